@@ -1,20 +1,77 @@
 #!/usr/bin/env python3
 
 import os
+import hashlib
+import importlib
+from contextlib import contextmanager
 from datetime import datetime
-from absl import app, flags, logging
-from absl.flags import FLAGS
+from absl import logging
 
-import pyvisa
+import queue
 import re
-from time import sleep
+import statistics
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from time import sleep, monotonic
+
+try:
+    from . import panel
+except ImportError:
+    import panel
 
 ADDR= "USB0::0x6656::0x0834::1485061822::INSTR"
-flags.DEFINE_integer('debug', -1, '-3=fatal, -1=warning, 0=info, 1=debug')
-flags.DEFINE_string('addr', ADDR, "UTG900 pyvisa resource address")
-flags.DEFINE_string('captureDir', "pics", "Capture directory")
 
-CMD="UTG900.py"
+# Max. number of compiled key plans cached
+PLAN_CACHE_SIZE = 512
+
+VAL_UNIT_RE = re.compile( r"(?P<value>[0-9-\.]+)(?P<unit>[a-zA-Z%]+)" )
+
+# Compiled key sequence: steps are SCPI strings to write, float
+# seconds to pause, or UploadStep; 'panel' and 'ch' are panel state
+# and channel outputs after the plan
+KeyPlan = namedtuple( "KeyPlan", "steps panel ch" )
+UploadStep = namedtuple( "UploadStep", "filePath" )
+
+# Fields sweep() can step -> value entry method
+SWEEP_FIELDS = {
+    "freq": "ilFreq", "amp": "ilAmp", "offset": "ilOffset", "phase": "ilPhase", "duty": "ilDuty",
+}
+
+# Sweep point: (value,unit), monotonic times point was scheduled
+# and took effect (last key written)
+SweepPoint = namedtuple( "SweepPoint", "value scheduled effective" )
+
+# Unit families: unit -> power of ten relative to family base unit
+UNIT_SCALES = [
+    { "uHz": -6, "mHz": -3, "Hz": 0, "kHz": 3, "MHz": 6 },
+    { "mVpp": -3, "Vpp": 0 },
+    { "mVrms": -3, "Vrms": 0 },
+    { "mV": -3, "V": 0 },
+    { "ns": -9, "us": -6, "ms": -3, "s": 0, "ks": 3 },
+    { "deg": 0 },
+    { "%": 0 },
+    { "cyc": 0 },
+]
+
+# Device resolution (power of ten of family base unit), values
+# with finer digits cannot be entered
+UNIT_RESOLUTION = {
+    "Hz": -6, "Vpp": -4, "Vrms": -4, "V": -4, "s": -10, "deg": -2, "%": -2, "cyc": 0,
+}
+
+# Families accepting negative values
+UNIT_SIGNED = { "V", "deg" }
+
+# Device value range per family base unit: (min, max) inclusive,
+# family not listed = not limited here (UTG962 envelope: 60 MHz,
+# 20 Vpp / +-10 V into high impedance)
+UNIT_RANGE = { u: ( Decimal(lo), Decimal(hi) ) for u, ( lo, hi ) in {
+    "Hz": ( "0", "60000000" ), "Vpp": ( "0", "20" ), "Vrms": ( "0", "7.0711" ), "V": ( "-10", "10" ),
+    "deg": ( "-360", "360" ), "%": ( "0", "100" ),
+}.items() }
 
 def version():
     versionPath = os.path.join( os.path.dirname( __file__), "..", "VERSION")
@@ -28,71 +85,563 @@ class UTG962:
          Unit-T UTG900 signal generator PYVISA control wrapper.
          """
 
-         _rm = pyvisa.ResourceManager()
+         # Shared by all instances, closed when last user closes
+         _rm = None
+         _rmUsers = 0
+         _rmLock = threading.Lock()
+
+         @staticmethod
+         def resourceManager( acquire=False ):
+             """Shared pyvisa ResourceManager, created on first use
+
+             :acquire: count caller as user (see releaseResourceManager)
+             """
+             with UTG962._rmLock:
+                 if UTG962._rm is None:
+                     UTG962._rm = visa().ResourceManager()
+                 if acquire: UTG962._rmUsers += 1
+                 return UTG962._rm
+
+         @staticmethod
+         def releaseResourceManager():
+             """Drop one user of shared ResourceManager, close it after last user"""
+             with UTG962._rmLock:
+                 UTG962._rmUsers -= 1
+                 if UTG962._rmUsers > 0 or UTG962._rm is None: return
+                 rm, UTG962._rm = UTG962._rm, None
+             try:
+                 logging.info(  "Closing Resource manager {}".format(rm))
+                 rm.close()
+             except:
+                 logging.warn(  "Closing Resource manager {} - failed".format(rm))
+
          @staticmethod
          def list_resources():
-             return UTG962._rm.list_resources()
+             return UTG962.resourceManager().list_resources()
          
          # def list_resources(self):
          #     return UTG962._rm.list_resources()
              
 
          # Construct && close
-         def __init__( self, addr=ADDR,  debug = False ):
-            self.sgen = UTG962._rm.open_resource(addr)
+         # Max. length of one coalesced key write (bytes)
+         batchMaxBytes = 240
+         # Separator of coalesced keys, ':' returns to SCPI root
+         # (plain ';' would make 'KEY:F1;KEY:Down' read KEY:KEY:Down)
+         batchSep = ";:"
+         # Interval between readiness polls (seconds)
+         pollInterval = 0.005
+         # Max. bytes per read when reading binary block
+         blockChunk = 65536
+         # Max. wait between I/O retries (seconds)
+         retryMaxDelay = 5.0
+         # Output toggle keys -> channel
+         chKeys = { "KEY:CH1": 1, "KEY:CH2": 2 }
+         # Check screen after configuring (see verifyScreen)
+         verify = False
+         # Glyph template set decoding screen (see screenTemplates)
+         templates = None
+
+         # Key maps
+         numKeys = {
+             "0": "NUM0",
+             "1": "NUM1",
+             "2": "NUM2",
+             "3": "NUM3",
+             "4": "NUM4",
+             "5": "NUM5",
+             "6": "NUM6",
+             "7": "NUM7",
+             "8": "NUM8",
+             "9": "NUM9",
+             "-": "SYMBOL",
+             ".": "DOT",
+             ",": "DOT",
+         }
+         confMap  = {
+            "Freq":   "1",
+            "Amp":    "2",
+            "Offset": "3",
+            "Phase":  "4",
+         }
+         wave1Map  = {
+            "sine": "1",
+            "square": "2",
+            "pulse":  "3",
+            "ramp": "4",
+            "arb": "5",
+            "MHz": "6",
+         }
+         wave1PropsMap  = {
+            "Freq": "1",
+            "Amp": "2",
+            "Offset":  "3",
+            "Phase": "4",
+            "Duty": "5",
+            "Page Down": "6",
+         }
+         waveArbPropsMap  = {
+            "WaveFile": "1",
+            "Freq": "2",
+            "Amp": "3",
+            "Offset":  "4",
+            "Phase": "5",
+         }
+         wave2PropsMap  = {
+            "Raise": "1",
+            "Fall": "2",
+            "Page Up": "6",
+         }
+         freqUnit  = {
+            "uHz": "1",
+            "mHz": "2",
+            "Hz":  "3",
+            "kHz": "4",
+            "MHz": "5",
+         }
+         ampUnit  = {
+            "mVpp": "1",
+            "Vpp": "2",
+            "mVrms":  "3",
+            "Vrms": "4",
+            "Cancel": "6",
+         }
+         raiseFallUnit  = {
+            "ns":  "1",
+            "us":  "2",
+            "ms":  "3",
+            "s":   "4",
+            "ks":  "5",
+         }
+         offsetUnit  = {
+            "mV": "1",
+            "V": "2",
+         }
+         fileLocation  = {
+             # "Internal": "1",
+             "External": "2",
+         }
+         chSelect  = {
+            1: "1",
+            2: "2",
+         }
+         phaseUnit  = {
+            "deg": "1",
+         }
+         dutyUnit  = {
+            "%": "1",
+         }
+         countUnit  = {
+            "cyc": "1",
+         }
+         # Mode menu soft keys (layout from the manual, not verified
+         # on hardware; sim.py MODE_KEYS models the same layout)
+         modeMap  = {
+            "am": "1",
+            "fm": "2",
+            "pm": "3",
+            "sweep": "4",
+            "burst": "5",
+         }
+         # Mode menu soft key switching mode off
+         modeOffKey = "6"
+         # Mode property pages: parameter -> soft key
+         modePropsMap  = {
+            "am":    { "freq": "2", "depth": "3" },
+            "fm":    { "freq": "2", "dev": "3" },
+            "pm":    { "freq": "2", "dev": "3" },
+            "sweep": { "start": "1", "stop": "2", "time": "3" },
+            "burst": { "count": "1", "period": "2" },
+         }
+         # Mode parameter -> units accepted
+         modeParamUnits  = {
+            "am":    { "freq": freqUnit, "depth": dutyUnit },
+            "fm":    { "freq": freqUnit, "dev": freqUnit },
+            "pm":    { "freq": freqUnit, "dev": phaseUnit },
+            "sweep": { "start": freqUnit, "stop": freqUnit, "time": raiseFallUnit },
+            "burst": { "count": countUnit, "period": raiseFallUnit },
+         }
+         # Wave -> parameters it has
+         waveParams = {
+             "sine":   ( "freq", "amp", "offset", "phase" ),
+             "square": ( "freq", "amp", "offset", "phase", "duty" ),
+             "pulse":  ( "freq", "amp", "offset", "phase", "duty", "raised", "fall" ),
+             "ramp":   ( "freq", "amp", "offset", "phase" ),
+             "arb":    ( "freq", "amp", "offset", "phase" ),
+         }
+         # Parameter -> field name on screen (see glyphs.py)
+         screenFields = {
+             "raised": "raise",
+         }
+         # Parameter -> units accepted
+         paramUnits = {
+             "freq": freqUnit,
+             "amp": ampUnit,
+             "offset": offsetUnit,
+             "phase": phaseUnit,
+             "duty": dutyUnit,
+             "raised": raiseFallUnit,
+             "fall": raiseFallUnit,
+         }
+
+         def __init__( self, addr=ADDR,  debug = False, resource=None, batch=None, pollReady=False, trackMenu=False, record=None,
+                       reset=True, outputs=None, retries=0, retryDelay=0.1, timeout=None, verify=False, templates=None ):
+            """
+            :addr: pyvisa resource address, 'SIM' for simulated UTG900,
+            or 'REPLAY:<trace file>' to replay recorded session
+
+            :resource: already opened (e.g. simulated) resource to use instead of 'addr'
+
+            :batch: max number of KEY -commands coalesced into one
+            write (None, 0, 1 = each key press written separately)
+
+            :pollReady: instead of fixed sleeps, poll device readiness
+            (fixed sleep used as upper bound)
+
+            :trackMenu: keep tracked front panel menu state also when
+            panel is unlocked (=nobody uses the front panel), avoids
+            re-entering known state on each command
+
+            :record: path of trace file recording VISA traffic (see trace.py)
+
+            :reset: send *RST after connecting, False: keep device
+            configuration (e.g. reconnecting to a running setup)
+
+            :outputs: (ch1,ch2) output states when 'reset' is False,
+            default both off
+
+            :retries: retry failed write/query/read_raw this many times,
+            reopening resource (without reset) between attempts, a
+            write is aborted after reopening (see retryIo)
+
+            :retryDelay: wait before first retry (seconds), doubled for
+            each retry up to 'retryMaxDelay'
+
+            :timeout: resource I/O timeout (ms), None = VISA default
+
+            :verify: after generate()/arbGenerate()/configure() check
+            values shown on screen (see verifyScreen), requires numpy
+            && calibrated 'templates' unless 'addr' is simulated
+
+            :templates: path of glyph template set calibrated for the
+            device screen (see glyphs.calibrate, calibrateScreen)
+            """
+            self.verify = verify
+            self.addr = addr
+            if templates is not None:
+                self.templates = localModule( "glyphs" ).loadTemplates( templates )
+            if verify and self.templates is None and not localModule( "sim" ).isSimAddr( addr ):
+                msg = "verify: no calibrated glyph templates for '{}' (see calibrateScreen)".format( addr )
+                logging.error(msg)
+                raise ValueError(msg)
+            self.retries = retries
+            self.retryDelay = retryDelay
+            self.timeout = timeout
+            self.rmUser = False
+            if resource is not None:
+                self.sgen = resource
+            else:
+                self.sgen = self.openResource(addr)
+                self.rmUser = self.visaAddr( addr )
+            if record:
+                self.sgen = localModule( "trace" ).TraceRecorder( self.sgen, record )
+            if timeout is not None:
+                self.sgen.timeout = timeout
             self.debug = debug
+            self.batch = batch
+            self.keyBuf = []
+            # filePath -> upload content encoded by arbGeneratePlan
+            self.uploads = {}
+            self.pollReady = pollReady
+            self.trackMenu = trackMenu
+            self.panel = None
             if self.debug:
-                 pyvisa.log_to_screen()
+                 visa().log_to_screen()
             try:
                 self.idn = self.sgen.query('*IDN?')
                 logging.warning("Successfully connected  '{}' with '{}'".format(addr, self.idn))
             except:
                 pass
-            self.reset()
+            if reset:
+                self.reset()
+            else:
+                # Device configuration unknown, outputs as told
+                self.ch = list( outputs or ( False, False ))
+                self.shadow = [ {}, {} ]
+
+         @staticmethod
+         def visaAddr( addr ):
+             """True if 'addr' is opened with VISA ResourceManager"""
+             return not ( localModule( "sim" ).isSimAddr( addr ) or localModule( "trace" ).isReplayAddr( addr ))
+
+         @staticmethod
+         def openResource( addr ):
+             if localModule( "sim" ).isSimAddr( addr ):
+                 return localModule( "sim" ).UTG962Sim( addr=addr )
+             if localModule( "trace" ).isReplayAddr( addr ):
+                 return localModule( "trace" ).ReplayResource( addr )
+             rm = UTG962.resourceManager( acquire=True )
+             try:
+                 return rm.open_resource(addr)
+             except:
+                 UTG962.releaseResourceManager()
+                 raise
 
          def close(self ):
+             """Close resource
+
+             :return: False if flushing keys or closing failed (logged)
+             """
+             ok = True
+             try:
+                 self.flush()
+             except Exception as err:
+                 logging.error(  "Closing sgen {} - flushing {} keys failed: {}".format(self.sgen, len(self.keyBuf), err))
+                 self.keyBuf = []
+                 ok = False
              try:
                  logging.info(  "Closing sgen {}".format(self.sgen))
                  self.sgen.close()
-             except:
-                 logging.warning(  "Closing sgen {} - failed".format(self.sgen))                 
-                 pass
+             except Exception as err:
+                 logging.error(  "Closing sgen {} - failed: {}".format(self.sgen, err))
+                 ok = False
+             if self.rmUser:
+                 self.rmUser = False
+                 UTG962.releaseResourceManager()
+             return ok
+
+         def reopen(self):
+             """Reopen resource in place, without *RST
+
+             Device keeps generating && its configuration, tracked
+             output states (self.ch) && channel shadows are kept when
+             the reopened device identifies itself as before (UTG900
+             has no query for output state), otherwise channel shadows
+             are cleared (call reset() for known state). Menu state is
+             re-entered on next command.
+
+             Simulated && replayed resources have no connection to
+             reopen, they are kept.
+
+             :raise: I/O error when reopened device does not answer *IDN?
+             """
+             holder, resource = None, self.sgen
+             while getattr( type(resource), "wraps", False ):
+                 # Recorder/metrics proxies stay, resource they wrap is replaced
+                 holder, resource = resource, resource.resource
+             if self.visaAddr( self.addr ):
+                 logging.warning( "Reopening {}".format(self.addr))
+                 try:
+                     resource.close()
+                 except Exception as err:
+                     logging.warning( "Reopening {} - closing old resource failed: {}".format(self.addr, err))
+                 resource = self.openResource( self.addr )
+                 if self.rmUser:
+                     # openResource acquired ResourceManager again
+                     UTG962.releaseResourceManager()
+                 self.rmUser = True
+                 if holder is None:
+                     self.sgen = resource
+                 else:
+                     object.__setattr__( holder, "resource", resource )
+                 if self.timeout is not None:
+                     self.sgen.timeout = self.timeout
+             self.keyBuf = []
+             self.panel = None
+             idn = self.idn if hasattr( self, "idn") else None
              try:
-                 logging.info(  "Closing Resource manager {}".format(UTG962._rm))
-                 UTG962._rm.close()
-                 UTG962._rm = None
-             except:
-                 logging.warn(  "Closing Resource manager {} - failed".format(UTG962._rm))
-                 pass
+                 self.idn = resource.query('*IDN?')
+             except ioErrors() as err:
+                 logging.warning( "Reopening {} - *IDN? failed: {}".format(self.addr, err))
+                 raise
+             if idn is None or self.idn != idn:
+                 logging.warning( "Reopened {} '{}', was '{}': configuration unknown".format(self.addr, self.idn, idn))
+                 self.shadow = [ {}, {} ]
+                 self.ch = [ None, None ]
+
+         def retryIo(self, op, *args, reopen=True ):
+             """Call resource method 'op', on I/O error retry with
+             exponential backoff (reopening resource when 'reopen')
+
+             Writes are not idempotent (KEY presses toggle, navigate,
+             edit values) && a failed write may have reached the
+             device: only queries are repeated on a reopened resource.
+             A write is not repeated once resource has been reopened,
+             menu state && channel shadows are cleared && I/O error
+             raised, which aborts the running key plan (see writeCmd
+             for output states).
+             """
+             delay = self.retryDelay
+             attempt = 0
+             failed = None
+             while True:
+                 try:
+                     if failed is None:
+                         return getattr( self.sgen, op )( *args )
+                     # Failed write is not repeated, reconnect only
+                     self.reopen()
+                     break
+                 except ioErrors() as err:
+                     if attempt >= self.retries: raise
+                     attempt += 1
+                     logging.warning( "{} failed: {}, retry {}/{} in {:.3f}s".format(
+                         op if failed is None else "reopen", err, attempt, self.retries, delay ))
+                     sleep( delay )
+                     delay = min( 2 * delay, self.retryMaxDelay )
+                     if not reopen: continue
+                     if op != "query":
+                         failed = failed or err
+                         continue
+                     try:
+                         self.reopen()
+                     except ioErrors() as reopenErr:
+                         logging.warning( "Reopen failed: {}".format(reopenErr))
+             self.panel = None
+             self.shadow = [ {}, {} ]
+             msg = "{} failed: {}, reopened {}, device state unknown - aborted".format( op, failed, self.addr )
+             logging.error( msg )
+             raise IOError( msg ) from failed
 
 
          # Low level commuincation 
          def write(self, cmd ):
-              self.sgen.write(cmd)
+              if cmd.startswith( "KEY:"):
+                  self.panel = panel.step( self.panel, cmd[4:] )
+              self.send( cmd )
+         def send(self, cmd ):
+              """Write 'cmd' (coalesced in batch mode), no panel tracking"""
+              if self.batch is not None and self.batch > 1 and cmd.startswith( "KEY:"):
+                  # Coalesce key presses, SCPI ';:' separated
+                  if self.keyBuf and len(self.batchSep.join(self.keyBuf)) + len(self.batchSep) + len(cmd) > self.batchMaxBytes:
+                      self.flush()
+                  self.keyBuf.append( cmd )
+                  if len(self.keyBuf) >= self.batch:
+                      self.flush()
+                  return
+              self.flush()
+              self.writeCmd( cmd )
+         def flush(self):
+              """Write key presses buffered in batch mode"""
+              if not self.keyBuf: return
+              cmd = self.batchSep.join(self.keyBuf)
+              self.keyBuf = []
+              self.writeCmd( cmd )
+         def writeCmd(self, cmd ):
+              """Write 'cmd' with retries, output toggled by a failed
+              write is unknown (None in self.ch) until reset()"""
+              try:
+                  self.retryIo( "write", cmd )
+              except ioErrors():
+                  for key in cmd.split( self.batchSep ):
+                      if key in self.chKeys:
+                          self.ch[self.chKeys[key]-1] = None
+                  raise
+         def write_raw(self, data ):
+              self.flush()
+              self.panel = panel.uploaded( self.panel )
+              return self.retryIo( "write_raw", data )
          def read_raw(self):
-              return self.sgen.read_raw()
+              self.flush()
+              # Response lost with reopened resource: wait longer only
+              return self.retryIo( "read_raw", reopen=False )
+         def pause(self, secs ):
+              """Let device settle (after buffered keys have been sent)"""
+              self.flush()
+              if self.pollReady:
+                  self.waitReady( secs )
+              else:
+                  sleep( secs )
+         def waitReady(self, maxWait ):
+              """Poll *OPC? until device reports ready, at most 'maxWait' seconds
+
+              Polls the resource directly, without retries or reopening
+              (a timed out poll just means: not ready yet).
+
+              :return: True if device reported ready within 'maxWait'
+              """
+              self.flush()
+              deadline = monotonic() + maxWait
+              while True:
+                  remaining = deadline - monotonic()
+                  if remaining <= 0: return False
+                  try:
+                      with self.timeoutLimit( remaining ):
+                          if self.sgen.query( "*OPC?").rstrip() == "1": return True
+                  except visa().errors.VisaIOError as err:
+                      logging.debug( "waitReady: {}".format(err))
+                  sleep( min( self.pollInterval, max( 0, deadline - monotonic())))
+         @contextmanager
+         def timeoutLimit(self, secs ):
+              """Bound resource I/O timeout to at most 'secs' seconds"""
+              timeout = self.sgen.timeout
+              limit = max( 1, int( secs * 1000))
+              self.sgen.timeout = limit if timeout is None else min( timeout, limit)
+              try:
+                  yield
+              finally:
+                  self.sgen.timeout = timeout
          def query(self, cmd, strip=False ):
-              ret = self.sgen.query(cmd)
+              self.flush()
+              ret = self.retryIo( "query", cmd )
               if strip: ret = ret.rstrip()
               return( ret )
 
          # LL (low level language =keypress)
          def llSShot(self):
-           self.write( "Display:Data?")
-           sleep( 0.4 )
-           data = self.read_raw()
-           # Skip header stuff
-           return data[15:]
+           """Screen capture bitmap (bytes-like)"""
+           data = self.llData()
+           # Bitmap follows vendor prefix bytes
+           start = bytes( data[:16] ).find( b"BM")
+           return memoryview( data )[max(start, 0):]
          def llReset(self):
            self.write( "*RST" )
+           self.panel = None
+           # Settings && loaded arb files forgotten
+           self.shadow = [ {}, {} ]
          def llLock(self):
            self.write( "System:LOCK on")
          def llOpen(self):
            self.write( "System:LOCK off")
+           if not self.trackMenu: self.panel = None
          def llCh(self, ch):
            self.write( "KEY:CH{}".format(ch))
-         def llData(self,*args, **kwargs):
-           return self.query_binary_values( "Display:Data?", *args, **kwargs )
+         def llData(self):
+           """Display:Data? response block payload"""
+           self.write( "Display:Data?")
+           return self.llBlock()
+         def llBlock(self):
+           """Read IEEE 488.2 definite length block '#<n><length><data>'
+
+           Reads exactly <length> bytes in chunks into preallocated
+           buffer, waits for data only as long as it takes to arrive,
+           then the response terminator (NL^END) so that the next
+           query does not read it.
+
+           :return: bytearray with block data
+           """
+           self.flush()
+           head = bytes( self.sgen.read_bytes( 2 ))
+           if head[:1] != b"#" or not head[1:2].isdigit():
+               msg = "Invalid block header {}".format( head )
+               logging.error(msg)
+               raise ValueError(msg)
+           nDigits = int( head[1:2] )
+           if nDigits == 0:
+               # Indefinite length block: up to END
+               return bytearray( self.sgen.read_raw())
+           length = int( self.sgen.read_bytes( nDigits ))
+           data = bytearray( length )
+           view = memoryview( data )
+           pos = 0
+           while pos < length:
+               chunk = self.sgen.read_bytes( min( self.blockChunk, length - pos ))
+               view[pos:pos+len(chunk)] = chunk
+               pos += len(chunk)
+           # Response terminator: up to END
+           rest = self.sgen.read_raw()
+           if rest.strip():
+               logging.warning( "Ignored {} bytes after block".format( len(rest)))
+           return data
          def llWave(self):
            self.write( "KEY:Wave")
          def llUtility(self):
@@ -113,23 +662,8 @@ class UTG962:
            self.llKey("Right")
          def llNum(self, numStr):
            def ch2cmd( ch ):
-               chMap = {
-                   "0": "NUM0",
-                   "1": "NUM1",
-                   "2": "NUM2",
-                   "3": "NUM3",
-                   "4": "NUM4",
-                   "5": "NUM5",
-                   "6": "NUM6",
-                   "7": "NUM7",
-                   "8": "NUM8",
-                   "9": "NUM9",
-                   "-": "SYMBOL",
-                   ".": "DOT",
-                   ",": "DOT",
-               }
                try:
-                  keyName = chMap[ch]
+                  keyName = self.numKeys[ch]
                   return  keyName
                except KeyError:
                      logging.fatal( "Could not extract keyName for ch {} numStr {}".format( ch, numStr ))
@@ -148,29 +682,48 @@ class UTG962:
 
          # IL intermediate (=action in a given mode)
          def ilFreq( self, freq, unit ):
-             self.llNum( str(freq))
+             freq, unit = encodeValue( str(freq), unit, tuple(self.freqUnit) )
+             self.llNum( freq )
              self.ilFreqUnit( unit )
          def ilAmp( self, amp, unit ):
-             self.llNum( str(amp))
+             amp, unit = encodeValue( str(amp), unit, tuple(self.ampUnit) )
+             self.llNum( amp )
              self.ilAmpUnit( unit )
          def ilOffset( self, offset, unit ):
-             self.llNum( str(offset))
+             offset, unit = encodeValue( str(offset), unit, tuple(self.offsetUnit) )
+             self.llNum( offset )
              self.ilOffsetUnit( unit )
          def ilPhase( self, freq, unit ):
-             self.llNum( str(freq))
+             freq, unit = encodeValue( str(freq), unit, tuple(self.phaseUnit) )
+             self.llNum( freq )
              self.ilPhaseUnit( unit )
          def ilDuty( self, duty, unit ):
-             self.llNum( str(duty))
+             duty, unit = encodeValue( str(duty), unit, tuple(self.dutyUnit) )
+             self.llNum( duty )
              self.ilDutyUnit(unit)
          def ilRaiseFall( self, raiseFall, unit ):
-             self.llNum( str(raiseFall))
+             raiseFall, unit = encodeValue( str(raiseFall), unit, tuple(self.raiseFallUnit) )
+             self.llNum( raiseFall )
              self.ilRaiseFallUnit(unit)
          def ilScreenShot( self, filePath="tmp/apu.jpg"):
+             # Query binary screenshot
+             sShot = self.llSShot()
+             try:
+                 dib = localModule( "dib" )
+             except ImportError as err:
+                 logging.info( "ilScreenShot: in-memory decoding not available ({}), using convert".format(err))
+                 dib = None
+             if dib is not None:
+                 # Decode, flip over && encode in memory
+                 logging.info( "ilScreenShot: filePath={}".format(filePath) )
+                 try:
+                     dib.writeImage( sShot, filePath )
+                     return
+                 except dib.ImageFormatError as err:
+                     logging.info( "ilScreenShot: {}, using convert".format(err))
              fileDir = os.path.dirname(filePath )
              filePathDib = os.path.join(fileDir, "__UTG-capture__.bmp" )
              logging.info( "ilScreenShot: fileDir={}, filePathDib={} -> filePath={}".format(fileDir, filePathDib, filePath) )
-             # Query binary screenshot
-             sShot = self.llSShot()
              with open( filePathDib, "wb") as f:
                   f.write( sShot)
              # Need to flip it over && convert to ext
@@ -179,141 +732,100 @@ class UTG962:
              """Expect to be in Arb/WaveFile waitin for file loaction &&
              updaload
              
-             :filePath: path to binary bsv -file
+             :filePath: path to binary bsv -file (or csv -file)
 
              :fileName: name to show in UTG900 signal generator
 
              """
              self.ilFileLocation( "External")
-             with open( filePath, mode="rb") as fh:
-                 arbdata = fh.read()
-                 fileNameCommand = "WARB1:Carrier {}".format(fileName)
-                 self.write(fileNameCommand+chr(0))
-                 self.sgen.write_raw(arbdata)                 
+             fileNameCommand = "WARB1:Carrier {}".format(fileName)
+             self.write(fileNameCommand+chr(0))
+             self.ilUpload( filePath )
+         def ilUpload( self, filePath ):
+             """Upload binary bsv -file content, CSV -file encoded to bsv"""
+             data = self.uploads.pop( filePath, None )
+             self.write_raw( data if data is not None else uploadData( filePath ))
          def ilConf( self, wave ):
-             waveMap  = {
-                "Freq":   "1",
-                "Amp":    "2",
-                "Offset": "3",
-                "Phase":  "4",
-             }
-             self.llFKey( val=wave, keyMap = waveMap )
+             self.llFKey( val=wave, keyMap = self.confMap )
 
          def ilWave1( self, wave ):
              """Selec wave type"""
-             waveMap  = {
-                "sine": "1",
-                "square": "2",
-                "pulse":  "3",
-                "ramp": "4",
-                "arb": "5",
-                "MHz": "6",
-             }
-             self.llFKey( val=wave, keyMap = waveMap )
+             self.llFKey( val=wave, keyMap = self.wave1Map )
 
          def ilWave1Props( self, wave ):
              """Wave properties, page1"""
-             waveMap  = {
-                "Freq": "1",
-                "Amp": "2",
-                "Offset":  "3",
-                "Phase": "4",
-                "Duty": "5",
-                "Page Down": "6",
-             }
-             self.llFKey( val=wave, keyMap = waveMap )
+             self.llFKey( val=wave, keyMap = self.wave1PropsMap )
 
          def ilWaveArbProps( self, wave ):
              """Arb Wave properties"""
-             waveMap  = {
-                "WaveFile": "1",
-                "Freq": "2",
-                "Amp": "3",
-                "Offset":  "4",
-                "Phase": "5",
-             }
-             self.llFKey( val=wave, keyMap = waveMap )
+             self.llFKey( val=wave, keyMap = self.waveArbPropsMap )
+
+         def ilMode( self, mode ):
+             """Select sweep/modulation/burst in Mode menu"""
+             self.llFKey( val=mode, keyMap = self.modeMap )
+
+         def ilModeOff( self, ch ):
+             """Switch sweep/modulation/burst mode of channel 'ch' off"""
+             self.ilChooseChannel( ch )
+             self.llMode()
+             self.llF( self.modeOffKey )
 
          def ilWave2Props( self, wave ):
              """Wave properties, page2"""
-             waveMap  = {
-                "Raise": "1",
-                "Fall": "2",
-                "Page Up": "6",
-             }
-             self.llFKey( val=wave, keyMap = waveMap )
+             self.llFKey( val=wave, keyMap = self.wave2PropsMap )
 
          # Units
+         def ilGoto( self, goal ):
+             """Press shortest key sequence from tracked panel state to 'goal'
+
+             :goal: predicate on panel.PanelState
+             """
+             keys = panel.plan( self.panel, goal )
+             if keys is None:
+                 msg = "No key path from panel state {}".format( self.panel )
+                 logging.error(msg)
+                 raise ValueError(msg)
+             for key in keys:
+                 self.llKey( key )
+         def ilSelectField( self, ch, field ):
+             """Start entering value for 'field' on channel 'ch' property page"""
+             self.ilGoto( panel.atEntry( int(ch), field ))
          def ilChooseChannel( self, ch ):
              """Key sequence to to bring UTG962 to display to a known state. 
              
              Here, invoke Utility option, use function key F1 or F2 to
              choose channel. Do it twice (and visit Wave menu in between)
 
+             When panel state is tracked, go to wave menu of channel
+             'ch' with the shortest key sequence instead.
              """
              ch = int(ch)
+             if self.panel is not None:
+                 self.ilGoto( panel.atWave( ch ))
+                 return
              self.llUtility()
              self.ilUtilityCh( ch )
              self.llWave()
              self.llUtility()
              self.ilUtilityCh( ch )
              self.llWave()
-             sleep( 0.1)
+             self.pause( 0.1)
          def ilFreqUnit( self, unit ):
-             freqUnit  = {
-                "uHz": "1",
-                "mHz": "2",
-                "Hz":  "3",
-                "kHz": "4",
-                "MHz": "5",
-             }
-             self.llFKey( val=unit, keyMap = freqUnit )
+             self.llFKey( val=unit, keyMap = self.freqUnit )
          def ilAmpUnit( self, unit ):
-             ampUnit  = {
-                "mVpp": "1",
-                "Vpp": "2",
-                "mVrms":  "3",
-                "Vrms": "4",
-                "Cancel": "6",
-             }
-             self.llFKey( val=unit, keyMap = ampUnit )
+             self.llFKey( val=unit, keyMap = self.ampUnit )
          def ilRaiseFallUnit( self, unit ):
-             raiseFallUnit  = {
-                "ns":  "1",
-                "us":  "2",
-                "ms":  "3",
-                "s":   "4",
-                "ks":  "5",                 
-             }
-             self.llFKey( val=unit, keyMap = raiseFallUnit )
+             self.llFKey( val=unit, keyMap = self.raiseFallUnit )
          def ilOffsetUnit( self, unit ):
-             offsetUnit  = {
-                "mV": "1",
-                "V": "2",
-             }
-             self.llFKey( val=unit, keyMap = offsetUnit )
+             self.llFKey( val=unit, keyMap = self.offsetUnit )
          def ilFileLocation( self, location ):
-             fileLocation  = {
-                 # "Internal": "1",
-                 "External": "2",
-             }
-             self.llFKey( val=location, keyMap=fileLocation )
+             self.llFKey( val=location, keyMap= self.fileLocation )
          def ilUtilityCh( self, ch ):
-             chSelect  = {
-                1: "1",
-                2: "2",
-             }
-             self.llFKey( val=ch, keyMap = chSelect )
+             self.llFKey( val=ch, keyMap = self.chSelect )
          def ilPhaseUnit( self, unit ):
-             phaseUnit  = {
-                "deg": "1",
-             }
-             self.llFKey( val=unit, keyMap = phaseUnit )
+             self.llFKey( val=unit, keyMap = self.phaseUnit )
          def ilDutyUnit( self, unit ):
-             dutyUnit  = {
-                "%": "1",
-             }
-             self.llFKey( val=unit, keyMap = dutyUnit )
+             self.llFKey( val=unit, keyMap = self.dutyUnit )
 
           # Utils
          def dibToImage( self, dibFilePath, resultPath ):
@@ -322,16 +834,84 @@ class UTG962:
              os.system(cmd)
              return(resultPath)
 
+         def shadowDiff( self, ch, wave, params, force=False ):
+             """Parameters to send to channel 'ch' to reach 'wave' && 'params'
+
+             Channel shadow is cleared when wave type changes (device
+             state of the parameters unknown).
+
+             :params: dict of parameter values (None or empty = not set)
+
+             :return: (sameWave, dict paramName -> (value,unit) of
+             changed parameters, encoded with encodeValue)
+             """
+             shadow = self.shadow[ch-1]
+             sameWave = not force and shadow.get("wave") == wave
+             if not sameWave:
+                 shadow.clear()
+             changes = {}
+             for k, v in params.items():
+                 if v is None or not v: continue
+                 valUnit = self.valUnit( v ) if isinstance( v, str) else v
+                 valUnit = encodeValue( str(valUnit[0]), valUnit[1], tuple(self.paramUnits[k]) )
+                 if sameWave and shadow.get(k) == valUnit: continue
+                 changes[k] = valUnit
+             return sameWave, changes
+
          def otherCh( self, ch ):
              return 1 if ch == 2 else 2
 
          def valUnit( self, valUnitsStr ):
-                match = re.search( r"(?P<value>[0-9-\.]+)(?P<unit>[a-zA-Z%]+)", valUnitsStr )
-                if match is None:
-                      msg = "Could not extract unit value from '{}'".format( valUnitsStr )
-                      logging.error(msg)
-                      raise ValueError(msg)
-                return ( match.group('value'), match.group('unit') )
+                return parseValUnit( valUnitsStr )
+
+         def keyPlan( self, ch, wave, sameWave, changes, arbFile=None, modeOff=False ):
+             """Compiled key plan from current panel && output state
+
+             Plans are cached (see compilePlan).
+
+             :changes: dict paramName -> (value,unit) to configure
+
+             :arbFile: (filePath, fileName) for arb wave, filePath
+             None when file need not be uploaded
+
+             :modeOff: leave sweep/modulation/burst mode first
+             """
+             return compilePlan( self.panel, self.trackMenu, tuple(self.ch), int(ch), wave,
+                                 sameWave, tuple( sorted( changes.items())), arbFile, modeOff )
+
+         def outputPlan( self, ch, state ):
+             """Key plan for on(ch) (state True) or off(ch)"""
+             recorder = KeyRecorder( self.panel, self.trackMenu, self.ch )
+             if state:
+                 recorder.on( ch )
+             else:
+                 recorder.off( ch )
+             return recorder.recordedPlan()
+
+         def runPlan( self, plan ):
+             """Execute compiled key plan"""
+             try:
+                 for step in plan.steps:
+                     if isinstance( step, str):
+                         self.sendStep( step )
+                     elif isinstance( step, UploadStep ):
+                         self.ilUpload( step.filePath )
+                     else:
+                         self.pause( step )
+             except:
+                 self.panel = None
+                 raise
+             self.panel = plan.panel
+             self.ch = list( plan.ch )
+
+         def sendStep( self, cmd ):
+             """Send key plan step 'cmd', output toggle (KEY:CHn)
+             tracked in self.ch as soon as it has been written"""
+             self.send( cmd )
+             if cmd in self.chKeys:
+                 self.flush()
+                 ch = self.chKeys[cmd]
+                 self.ch[ch-1] = not self.ch[ch-1]
 
          # API ---> 
          def reset(self):
@@ -340,25 +920,41 @@ class UTG962:
               self.llReset()
               self.llOpen()
 
+         def outputKnown(self, ch):
+              """Raise ValueError when output state of 'ch' is unknown
+              (failed write may have toggled it)"""
+              if self.ch[ch-1] is None:
+                  msg = "CH{} output state unknown after failed write, reset() first".format(ch)
+                  logging.error(msg)
+                  raise ValueError(msg)
+
          def on(self,ch):
               ch = int(ch)
+              self.outputKnown( ch )
               if self.ch[ch-1]: return;
               self.ilChooseChannel( ch )
               self.llCh(ch)
               self.ch[ch-1] = True
               self.llOpen()
-              sleep( 0.1)
+              self.pause( 0.1)
 
          def off(self,ch):
               ch = int(ch)
+              self.outputKnown( ch )
               if not self.ch[ch-1]: return;
               self.ilChooseChannel( ch )
               self.llCh(ch)
               self.ch[ch-1] = False
               self.llOpen()
-              sleep( 0.1)
+              self.pause( 0.1)
 
  
+         def screenArray( self ):
+             """Screen capture as RGB array (height x width x 3, requires numpy)"""
+             data = self.llSShot()
+             self.llOpen()
+             return localModule( "dib" ).dibArray( data )
+
          def screenShot( self, captureDir, fileName=None, ext="png"  ):
              if fileName is None:
                  now = datetime.now()
@@ -369,370 +965,721 @@ class UTG962:
              self.llOpen()
              return filePath
 
-         def generate( self, ch=1, wave="sine", freq=None, amp=None,  offset=None, phase=None, duty=None, raised=None, fall=None ):
+         def screenBurst( self, captureDir, count, interval=0.0, fileName=None, ext="png", workers=2, bufferSize=8 ):
+             """Capture 'count' screenshots back to back, 'interval' seconds apart
+
+             Frames are decoded, encoded && written by 'workers'
+             threads while capturing continues. At most 'bufferSize'
+             raw frames are buffered, capture waits when buffer is
+             full. Requires numpy (see dib.py).
+
+             :fileName: file name base, default UTG-<timestamp>
+
+             :return: list of file paths
+             """
+             dib = localModule( "dib" )
+             if fileName is None:
+                 base = "UTG-{}".format( datetime.now().strftime("%Y%m%d-%H%M%S"))
+             else:
+                 base, fileExt = os.path.splitext( fileName )
+                 ext = fileExt[1:] or ext
+             filePaths = [ os.path.join( captureDir, "{}-{:04d}.{}".format( base, i, ext)) for i in range(count) ]
+             logging.info( "screenBurst: count={}, interval={}, filePaths={}..".format( count, interval, filePaths[:1]) )
+             frames = queue.Queue( maxsize=bufferSize )
+             errors = []
+             def encoder():
+                 while True:
+                     frame = frames.get()
+                     if frame is None: return
+                     i, data = frame
+                     try:
+                         dib.writeImage( data, filePaths[i] )
+                     except Exception as err:
+                         logging.error( "screenBurst: {} failed: {}".format( filePaths[i], err ))
+                         errors.append( err )
+             with ThreadPoolExecutor( max_workers=workers ) as pool:
+                 encoders = [ pool.submit( encoder ) for _ in range(workers) ]
+                 try:
+                     start = monotonic()
+                     for i in range(count):
+                         wait = start + i * interval - monotonic()
+                         if wait > 0: sleep( wait )
+                         frames.put( (i, self.llSShot()) )
+                 finally:
+                     for _ in encoders: frames.put( None )
+             self.llOpen()
+             if errors: raise errors[0]
+             return filePaths
+
+         def generate( self, ch=1, wave="sine", freq=None, amp=None,  offset=None, phase=None, duty=None, raised=None, fall=None, force=False ):
              """sine, square, pulse generation
+
+             Only parameters differing from channel shadow state are
+             sent, and output is not switched off when wave type
+             remains the same.
+
+             :force: ignore shadow state, configure all parameters given
+             """
+             ch = int(ch)
+             changes, plan = self.generatePlan( ch, wave, freq=freq, amp=amp, offset=offset, phase=phase,
+                                                duty=duty, raised=raised, fall=fall, force=force )
+             self.runShadowPlan( ch, wave, changes, plan )
+
+         def generatePlan( self, ch, wave, force=False, **params ):
+             """Shadow changes && key plan for generate()
+
+             :return: (changes, plan)
+             """
+             modeOff = "mode" in self.shadow[ch-1]
+             sameWave, changes = self.shadowDiff( ch, wave, params, force=force )
+             return changes, self.keyPlan( ch, wave, sameWave, changes, modeOff=modeOff )
+
+         def arbGenerate( self, ch=1, wave="arb", filePath="tmp/apu.csv", freq=None, amp=None,  offset=None, phase=None, fileName="ARB", force=False ):
+             """Arb generation
+
+             Like generate(): only parameters differing from channel
+             shadow are sent, output stays on when channel already
+             generates arb wave. Upload is skipped when channel
+             already uses file 'fileName' with the same content.
+             
+             :fileName: name of file on UTG900 -device
+
+             :force: ignore shadow state, configure all parameters given
+             """
+             ch = int(ch)
+             changes, plan, arbFile = self.arbGeneratePlan( ch, wave, filePath, fileName, force=force,
+                                                            freq=freq, amp=amp, offset=offset, phase=phase )
+             self.runShadowPlan( ch, wave, changes, plan )
+             self.shadow[ch-1]["file"] = arbFile
+
+         def arbGeneratePlan( self, ch, wave, filePath, fileName, force=False, **params ):
+             """Shadow changes && key plan for arbGenerate()
+
+             :return: (changes, plan, arbFile), 'arbFile' is shadow
+             value for uploaded file
              """
+             modeOff = "mode" in self.shadow[ch-1]
+             sameWave, changes = self.shadowDiff( ch, wave, params, force=force )
+             arbFile = ( fileDigest( filePath ), fileName )
+             upload = not sameWave or self.shadow[ch-1].get("file") != arbFile
+             if upload:
+                 # Encoding errors raised before any key is sent
+                 self.uploads[filePath] = uploadData( filePath )
+             plan = self.keyPlan( ch, wave, sameWave, changes, arbFile=(filePath if upload else None, fileName), modeOff=modeOff )
+             return changes, plan, arbFile
+
+         def configure( self, settings, force=False ):
+             """Configure several channels in one pass
+
+             Like generate() for each entry of 'settings', but menu
+             navigation is shared, an output is switched off only
+             while its wave type changes, && outputs are switched on
+             back to back at the end.
+
+             :settings: list of dicts with 'ch', 'wave' (sine, square,
+             pulse, ramp) and generate() parameters, e.g. [ {"ch": 1,
+             "wave": "sine", "freq": "1kHz"}, {"ch": 2, "wave": "square"} ]
+
+             :force: ignore shadow state, configure all parameters given
+             """
+             entries = []
+             allChanges = {}
+             for setting in settings:
+                 params = dict( setting )
+                 ch = int( params.pop( "ch", None) or 1 )
+                 wave = params.pop( "wave", "sine")
+                 if ch in allChanges or wave == "arb":
+                     msg = "configure: {} (one entry per channel, arb with arbGenerate)".format(
+                         "channel {} configured twice".format(ch) if ch in allChanges else "arb wave not supported" )
+                     logging.error(msg)
+                     raise ValueError(msg)
+                 modeOff = "mode" in self.shadow[ch-1]
+                 sameWave, changes = self.shadowDiff( ch, wave, params, force=force )
+                 allChanges[ch] = ( wave, changes )
+                 entries.append( ( ch, wave, sameWave, tuple( sorted( changes.items())), modeOff ))
+             plan = compileConfigure( self.panel, self.trackMenu, tuple(self.ch), tuple(entries) )
+             try:
+                 self.runPlan( plan )
+             except:
+                 # Device state unknown
+                 for ch in allChanges: self.shadow[ch-1].clear()
+                 raise
+             for ch, ( wave, changes ) in allChanges.items():
+                 self.shadow[ch-1]["wave"] = wave
+                 self.shadow[ch-1].update( changes )
+                 self.shadow[ch-1].pop( "mode", None )
+             if self.verify: self.checkScreen( list( allChanges ))
+
+         def generateBoth( self, ch1, ch2, force=False ):
+             """configure() CH1 && CH2
+
+             :ch1, ch2: dicts with 'wave' and generate() parameters
+             """
+             self.configure( [ dict( ch1, ch=1 ), dict( ch2, ch=2 ) ], force=force )
+
+         def runShadowPlan( self, ch, wave, changes, plan ):
+             """Run 'plan' configuring 'changes' on channel 'ch', update shadow"""
+             shadow = self.shadow[ch-1]
+             try:
+                 self.runPlan( plan )
+             except:
+                 # Device state unknown
+                 shadow.clear()
+                 raise
+             shadow["wave"] = wave
+             shadow.update( changes )
+             # Plan left sweep/modulation/burst mode
+             shadow.pop( "mode", None )
+             if self.verify: self.checkScreen( [ch] )
+
+         def verifyScreen( self, ch=None ):
+             """Compare wave, output state && parameter values shown on
+             screen with tracked state (shadow, self.ch)
+
+             Screen capture decoded in memory with glyph templates
+             (see screenTemplates), requires numpy.
+
+             :ch: channel to check, None: both
+
+             :return: list of differences, empty when screen matches
+             """
+             tset = self.screenTemplates()
+             shown = localModule( "glyphs" ).screenText( localModule( "dib" ).dibArray( self.llSShot() ), tset )
+             diffs = []
+             for c in ( [ int(ch) ] if ch else [ 1, 2 ] ):
+                 output = "ON" if self.ch[c-1] else "OFF"
+                 if self.ch[c-1] is not None and shown[c]["output"] != output:
+                     diffs.append( "CH{} output: expected {}, screen '{}'".format( c, output, shown[c]["output"] ))
+                 shadow = self.shadow[c-1]
+                 if "wave" in shadow and shown[c]["wave"] != shadow["wave"].upper():
+                     diffs.append( "CH{} wave: expected {}, screen '{}'".format( c, shadow["wave"], shown[c]["wave"] ))
+                 for k, valUnit in shadow.items():
+                     if k not in self.paramUnits: continue
+                     text = shown[c].get( self.screenFields.get( k, k ), "")
+                     if not sameValue( text, valUnit ):
+                         diffs.append( "CH{} {}: expected {}{}, screen '{}'".format( c, k, valUnit[0], valUnit[1], text ))
+             return diffs
+
+         def screenTemplates( self ):
+             """Glyph template set decoding screen captures: calibrated
+             set loaded, simulator font for simulated device
+
+             :raise ValueError: no calibrated set for physical device
+             """
+             if self.templates is None and localModule( "sim" ).isSimAddr( self.addr ):
+                 # Simulator renders text with glyphs.py font
+                 self.templates = localModule( "glyphs" ).simTemplates()
+             if self.templates is None:
+                 msg = "No calibrated glyph templates for '{}' (see calibrateScreen)".format( self.addr )
+                 logging.error(msg)
+                 raise ValueError(msg)
+             return self.templates
+
+         def calibrateScreen( self, expected, filePath, layout=None ):
+             """Calibrate glyph templates from current screen && store
+             them to 'filePath' (load with UTG962(templates=filePath))
+
+             :expected: dict ch -> dict field -> text currently shown
+             on screen, read from the display (see glyphs.calibrate)
+
+             :layout: glyphs.Layout of text fields on screen, None:
+             glyphs.SIM_LAYOUT
+             """
+             glyphs = localModule( "glyphs" )
+             rgb = localModule( "dib" ).dibArray( self.llSShot() )
+             self.llOpen()
+             self.templates = glyphs.calibrate( rgb, expected, layout or glyphs.SIM_LAYOUT )
+             glyphs.saveTemplates( self.templates, filePath )
+             return self.templates
+
+         def checkScreen( self, chs ):
+             """verifyScreen() channels 'chs', forget their shadow && raise ValueError on difference"""
+             diffs = [ d for ch in chs for d in self.verifyScreen( ch ) ]
+             if diffs:
+                 for ch in chs: self.shadow[ch-1].clear()
+                 msg = "Screen differs from settings: {}".format( "; ".join( diffs ))
+                 logging.error(msg)
+                 raise ValueError(msg)
+
+         def ilGenerate( self, ch, wave, sameWave, changes ):
+             """Key sequence for generate()
+
+             :changes: dict paramName -> (value,unit) to configure
+             """
+             if sameWave and not changes:
+                 self.ilOn(ch)
+                 return
              # Deactivate
-             self.off(ch)
+             if not sameWave: self.off(ch)
              # Start config
              self.ilChooseChannel( ch )
              # At this point correct channel selected
              self.ilWave1( wave )
+             self.ilFields( ch, changes )
+             # Activate
+             self.ilOn(ch)
+
+         def ilOn( self, ch ):
+             """on() 'ch', panel unlocked also when output already on"""
+             if self.ch[ch-1]:
+                 self.llOpen()
+             else:
+                 self.on( ch )
+
+         def ilConfigure( self, entries ):
+             """Key sequence for configure()
+
+             :entries: list of (ch, wave, sameWave, changes, modeOff)
+             """
+             turnOn = []
+             for ch, wave, sameWave, changes, modeOff in entries:
+                 if modeOff:
+                     self.ilModeOff( ch )
+                 if not ( sameWave and not changes ):
+                     self.ilChooseChannel( ch )
+                     if not sameWave and self.ch[ch-1]:
+                         # Output off only while wave changes
+                         self.llCh( ch )
+                         self.ch[ch-1] = False
+                         self.pause( 0.1)
+                     self.ilWave1( wave )
+                     self.ilFields( ch, changes )
+                 if not self.ch[ch-1]: turnOn.append( ch )
+             # Outputs on back to back
+             for ch in turnOn:
+                 self.ilChooseChannel( ch )
+                 self.llCh( ch )
+                 self.ch[ch-1] = True
+             self.llOpen()
+             if turnOn: self.pause( 0.1)
+
+         def ilFields( self, ch, changes ):
+             """Enter 'changes' on property pages of selected wave"""
              # Frequencey (sine, square, pulse,arb)
-             if freq is not None and not not freq:
-                 # Without down would toggle Periosd
-                 self.llDown()
-                 self.ilWave1Props( "Freq")
-                 self.ilFreq( *self.valUnit( freq ) )
+             if "freq" in changes:
+                 # Path avoids toggling Period
+                 self.ilSelectField( ch, "freq")
+                 self.ilFreq( *changes["freq"] )
              # Amplification (sine, square, pulse, arb)
-             if amp is not None and not not amp:
-                 logging.info( "amp value:'{}'".format(amp))
-                 self.ilWave1Props( "Amp")
-                 self.ilAmp( *self.valUnit( amp ) )
+             if "amp" in changes:
+                 self.ilSelectField( ch, "amp")
+                 self.ilAmp( *changes["amp"] )
              # Offset (sine, square, pulse)
-             if offset is not None and not not offset:
-                 self.ilWave1Props( "Offset")
-                 self.ilOffset( *self.valUnit(offset))
+             if "offset" in changes:
+                 self.ilSelectField( ch, "offset")
+                 self.ilOffset( *changes["offset"] )
              # Phase (sine, square, pulse)
-             if phase is not None and not not phase:
-                 self.ilWave1Props( "Phase")
-                 self.ilPhase( *self.valUnit( phase ))
+             if "phase" in changes:
+                 self.ilSelectField( ch, "phase")
+                 self.ilPhase( *changes["phase"] )
              # Duty (square, pulse)
-             if duty is not None and not not duty:
-                 self.ilWave1Props( "Duty")
-                 self.ilDuty( *self.valUnit( duty ))
+             if "duty" in changes:
+                 self.ilSelectField( ch, "duty")
+                 self.ilDuty( *changes["duty"] )
              # Raise (pulse)
-             if raised is not None and not not raised:
-                 self.ilWave1Props( "Page Down")
-                 self.llDown()
-                 self.ilWave2Props( "Raise")
-                 # Expecting immediatelly raised value
-                 self.ilRaiseFall( *self.valUnit( raised ))
-                 self.ilWave2Props( "Page Up")
+             if "raised" in changes:
+                 # Page Down (page 2)
+                 self.ilSelectField( ch, "raise")
+                 self.ilRaiseFall( *changes["raised"] )
              # Fall (pulse)
-             if fall is not None and not not fall:
-                 self.ilWave1Props( "Page Down")
-                 # Switch to fall section
-                 self.ilWave2Props( "Fall")
-                 self.ilRaiseFall( *self.valUnit( fall ))
-                 self.ilWave2Props( "Page Up")
-             # Activate
-             self.on(ch)
+             if "fall" in changes:
+                 self.ilSelectField( ch, "fall")
+                 self.ilRaiseFall( *changes["fall"] )
 
-         def arbGenerate( self, ch=1, wave="arb", filePath="tmp/apu.csv", freq=None, amp=None,  offset=None, phase=None, fileName="ARB" ):
-             """Arb generation
-             
-             :fileName: name of file on UTG900 -device
+         def ilArbGenerate( self, ch, wave, filePath, fileName, sameWave, changes ):
+             """Key sequence for arbGenerate()
+
+             :filePath: file to upload, None = 'fileName' already loaded
+
+             :changes: dict paramName -> (value,unit) to configure
              """
+             if sameWave and not changes and filePath is None:
+                 self.ilOn(ch)
+                 return
              # Deactivate
-             self.off(ch)
+             if not sameWave: self.off(ch)
              # Start config
              self.ilChooseChannel( ch )
              # At this point correct channel selected
              self.ilWave1( wave )
              # Upload file
-             self.llDown()
-             self.ilWaveArbProps( "WaveFile")
-             self.ilWriteFile( filePath = filePath, fileName=fileName )
-             # Frequencey (sine, square, pulse,arb)
-             if freq is not None and not not freq:
-                 self.ilWaveArbProps( "Freq")
-                 self.ilFreq( *self.valUnit( freq ) )
+             if filePath is not None:
                  self.llDown()
-             # Amplification (sine, square, pulse, arb)
-             if amp is not None and not not amp:
-                 logging.info( "amp value:'{}'".format(amp))
-                 self.ilWaveArbProps( "Amp")
-                 self.ilAmp( *self.valUnit( amp ) )
-             # Offset (sine, square, pulse)
-             if offset is not None and not not offset:
-                 self.ilWaveArbProps( "Offset")
-                 self.ilOffset( *self.valUnit(offset))
-             # Phase (sine, square, pulse)
-             if phase is not None and not not phase:
-                 self.ilWaveArbProps( "Phase")
-                 self.ilPhase( *self.valUnit( phase ))
+                 self.ilWaveArbProps( "WaveFile")
+                 self.ilWriteFile( filePath = filePath, fileName=fileName )
+             self.ilFields( ch, changes )
              # Activate
-             self.on(ch)
+             self.ilOn(ch)
              
+         def sweep( self, ch=1, wave="sine", field="freq", values=(), dwell=1.0, **params ):
+             """Host driven sweep of 'field' through 'values'
+
+             Channel is configured with generate() using 'params' and
+             first value. After that only 'field' is re-entered, menu
+             state is tracked during sweep. Points are scheduled
+             'dwell' seconds apart on monotonic clock, starting when
+             the first point is set && menu ready, last point is held
+             'dwell'.
+
+             :values: list of value strings (e.g. '1kHz') or (value,unit) tuples
+
+             :return: list of SweepPoint
+             """
+             ch = int(ch)
+             # Validate all points before touching the device
+             values = self.sweepPoints( field, values, wave )
+             points = []
+             for i, valUnit in enumerate( values ):
+                 if i == 0:
+                     self.generate( ch, wave, **dict( params, **{ field: valUnit }))
+                     if self.panel is None:
+                         # Known menu state before schedule starts
+                         self.ilChooseChannel( ch )
+                         self.ilWave1( wave )
+                         self.flush()
+                     start = monotonic()
+                     points.append( SweepPoint( valUnit, start, start ))
+                     continue
+                 scheduled = start + i * dwell
+                 wait = scheduled - monotonic()
+                 if wait > 0: sleep( wait )
+                 self.ilSweepPoint( ch, field, valUnit )
+                 points.append( SweepPoint( valUnit, scheduled, monotonic() ))
+             if points:
+                 wait = start + len(points) * dwell - monotonic()
+                 if wait > 0: sleep( wait )
+                 self.llOpen()
+             return points
+
+         def sweepPoints( self, field, values, wave="sine" ):
+             """Validate sweep of 'field' of 'wave' through 'values'
+
+             :return: list of encoded (value,unit)
+             """
+             valid = [ f for f in SWEEP_FIELDS if f in self.waveParams.get( wave, ()) ]
+             if field not in valid:
+                 msg = "Can not sweep '{}' of wave '{}', valid fields: {}".format( field, wave, valid )
+                 logging.error(msg)
+                 raise ValueError(msg)
+             return [ encodeValue( str(v), u, tuple(self.paramUnits[field]))
+                      for v, u in ( self.valUnit(v) if isinstance( v, str) else v for v in values ) ]
+
+         def ilSweepPoint( self, ch, field, valUnit ):
+             """Re-enter only 'field' of generating channel 'ch'"""
+             shadow = self.shadow[ch-1]
+             try:
+                 if self.panel is None:
+                     self.ilChooseChannel( ch )
+                     self.ilWave1( shadow["wave"] )
+                 self.ilSelectField( ch, field )
+                 getattr( self, SWEEP_FIELDS[field] )( *valUnit )
+                 self.flush()
+             except:
+                 # Device state unknown
+                 self.panel = None
+                 shadow.clear()
+                 raise
+             shadow[field] = valUnit
+
+         def modeGenerate( self, ch=1, mode="sweep", **params ):
+             """Device side sweep, modulation or burst on channel 'ch'
+
+             Mode is applied to the wave channel 'ch' generates. All
+             parameters are validated before keys are sent.
+
+             :mode: am, fm, pm, sweep or burst
+
+             :params: mode parameters (see modePropsMap) as value
+             strings, e.g. start='1kHz', time='1s', count=5
+             """
+             ch = int(ch)
+             if mode not in self.modeMap:
+                 msg = "Invalid mode '{}', valid modes: {}".format( mode, list(self.modeMap.keys()))
+                 logging.error(msg)
+                 raise ValueError(msg)
+             entries = []
+             for field, v in params.items():
+                 if v is None or not v: continue
+                 if field not in self.modePropsMap[mode]:
+                     msg = "Invalid parameter '{}' for mode '{}', valid: {}".format( field, mode, list(self.modePropsMap[mode].keys()))
+                     logging.error(msg)
+                     raise ValueError(msg)
+                 units = self.modeParamUnits[mode][field]
+                 if isinstance( v, int) or ( isinstance( v, str) and v.isdigit()):
+                     # Unitless count
+                     v = ( str(v), "cyc" )
+                 valUnit = self.valUnit( v ) if isinstance( v, str) else v
+                 entries.append( ( field, encodeValue( str(valUnit[0]), valUnit[1], tuple(units)), units ))
+             try:
+                 self.ilChooseChannel( ch )
+                 self.llMode()
+                 self.ilMode( mode )
+                 for field, (value, unit), units in entries:
+                     self.llFKey( val=field, keyMap = self.modePropsMap[mode] )
+                     self.llNum( value )
+                     self.llFKey( val=unit, keyMap = units )
+                 self.ilOn(ch)
+             except:
+                 # Device state unknown
+                 self.shadow[ch-1].clear()
+                 raise
+             # generate() leaves mode first
+             self.shadow[ch-1]["mode"] = mode
+
+         def modeOff( self, ch=1 ):
+             """Leave sweep/modulation/burst mode of channel 'ch'"""
+             ch = int(ch)
+             try:
+                 self.ilModeOff( ch )
+                 self.llOpen()
+             except:
+                 self.shadow[ch-1].clear()
+                 raise
+             self.shadow[ch-1].pop( "mode", None )
+
+         def modulate( self, ch=1, mode="am", freq=None, depth=None, dev=None ):
+             """AM (freq, depth), FM (freq, dev) or PM (freq, dev) modulation"""
+             self.modeGenerate( ch, mode, freq=freq, depth=depth, dev=dev )
+
+         def deviceSweep( self, ch=1, start=None, stop=None, time=None ):
+             """Device side frequency sweep from 'start' to 'stop' in 'time'"""
+             self.modeGenerate( ch, "sweep", start=start, stop=stop, time=time )
+
+         def burst( self, ch=1, count=None, period=None ):
+             """Burst of 'count' cycles every 'period'"""
+             self.modeGenerate( ch, "burst", count=count, period=period )
+
          def getName(self):
             return( self.query( "*IDN?"))
 
-def list_resources():
-    return UTG962._rm.list_resources()
-        
-# ------------------------------------------------------------------
-# State && Global
-helpProps = {
-    "command" : "show help for command",
-}
 
-onOffProps  = {
-    'ch'    :   "Channel 1,2 to switch on/off",    
-}
+class KeyRecorder(UTG962):
+         """
+         UTG962 look-alike recording key plan steps instead of sending them.
+         """
+         def __init__( self, panelState, trackMenu, ch ):
+             self.debug = False
+             self.batch = None
+             self.keyBuf = []
+             self.pollReady = False
+             self.trackMenu = trackMenu
+             self.panel = panelState
+             self.ch = list(ch)
+             self.steps = []
+             self.uploads = {}
 
-screenCaptureProps  = {
-    'fileName'   :   "Screen capture file name (optional)",    
-}
+         def send(self, cmd ):
+             self.steps.append( cmd )
+         def pause(self, secs ):
+             self.steps.append( float(secs) )
+         def ilUpload( self, filePath ):
+             self.uploads.pop( filePath, None )
+             self.steps.append( UploadStep( filePath ))
+             self.panel = panel.uploaded( self.panel )
+         def recordedPlan( self ):
+             return KeyPlan( tuple(self.steps), self.panel, tuple(self.ch) )
 
-sineProps = onOffProps | {
-    'freq'  :   "Frequency [uHz|mHz|Hz|kHz|MHz]",
-    'amp'   :    "Amplitude [mVpp|Vpp|mVrms|Vrms]",
-    'offset': "Offset [mV|V]",
-    'phase' :  "Phase [deg]",
-}
-        
-arbProps = sineProps | {
-    'filePath'  :   "Path to waveform file",
-    'fileName'  :   "Name of the file on UTG900",
-}
-        
-squareProps = sineProps | {
-    'duty'  :   "Duty [%]",
-}
-        
-pulseProps = squareProps | {
-    'raised':   "Raise [ns,us,ms,s,ks]",
-    'fall'  :     "Fall [ns,us,ms,s,ks]",
-}
 
-subMenu = {
-    "sine"            : sineProps,
-    "square"          : squareProps,
-    "pulse"           : pulseProps,
-    "arb"             : arbProps,    
-    "on"              : onOffProps,
-    "off"             : onOffProps,
-    "screen"          :  screenCaptureProps,
-    "reset"           :  {},
-    "list_resources"  :  {},
-    "version"         :  {},
-}
+@lru_cache( maxsize=PLAN_CACHE_SIZE )
+def compilePlan( panelState, trackMenu, outputs, ch, wave, sameWave, changes, arbFile=None, modeOff=False ):
+    """Compile generate() (or arbGenerate() when 'arbFile' given) to KeyPlan
 
+    :panelState: panel state where plan starts
 
-mainMenu = {
-    'q'              : "Exit",
-    'Q'              : "Exit",
-    '?'              : "Usage help",
-    "sine"           : "Generate sine -wave on channel 1|2",
-    "square"         : "Generate square -wave on channel 1|2",
-    "pulse"          : "Generate pulse -wave on channel 1|2",
-    "arb"            : "Upload wave file and use it to generate wave on channel 1|2",
-    "on"             : "Switch on channel 1|2",
-    "off"            : "Switch off channel 1|2",
-    "reset"          : "Send reset to UTG900 signal generator",
-    "screen"         : "Take screenshot to 'captureDir'",
-    "list_resources" : "List pyvisa resources (=pyvisa list_resources() wrapper)'",
-    "version"        : "Output version number",
-}
+    :outputs: tuple of channel output states where plan starts
 
+    :changes: tuple of (paramName, (value,unit)) -pairs to configure
 
+    :arbFile: (filePath, fileName) -tuple for arb wave, filePath None
+    when file is already loaded
 
-# ------------------------------------------------------------------
-def mainMenuHelp(mainMenu):
-    print( "{} - {}: Tool to control UNIT-T UTG900 Waveform generator".format(CMD, version()) )
-    print( "" )
-    print( "Usage: {} [options] [commands and parameters] ".format( CMD ))
-    print( "" )
-    print( "Commands:")
-    for k,v in mainMenu.items():
-        print( "%15s  : %s" % (k,v) )
-    print( "" )
-    print( "More help:")
-    print( "  {} --help                          : to list options".format(CMD) )
-    print( "  {} ? command=<command>             : to get help on command <command> parameters".format(CMD) )
-    print( "")
-    print( "Examples:")
-    print( "  {}                                 : start interactive mode".format(CMD))
-    print( "  {} ? command=sine                  : help on sine command parameters".format(CMD))
-    print( "  {} list_resources                  : Identify --addr option parameter".format(CMD))
-    print( "  {} --addr 'USB0::1::2::3::0::INSTR': Run interactively on device found in --addr 'USB0::1::2::3::0::INSTR'".format(CMD))
-    print( "  {} --captureDir=pics screen        : Take screenshot to pics directory (form device in default --addr)".format(CMD))
-    print( "  {} reset                           : Send reset to UTH900 waveform generator".format(CMD))    
-    print( "  {} sine ch=2 freq=2kHz             : Generate 2 kHz sine signal on channel 2".format(CMD))
-    print( "  {} sine ch=1 square ch=2           : chaining sine generation on channel 1, and square generation on channel 2".format(CMD))
-    
-    print( "")
-    print( "Hint:")
-    print( "  One-liner in linux: {} --addr $({} list_resources)".format(CMD, CMD))
-    
-
-def subMenuHelp( command, menuText, subMenu ):
-    print( "{} - {}".format( command, menuText))
-    print( "" )
-    if len(subMenu.keys()) > 0:
-       for k,v in subMenu.items():
-           print( "%10s  : %s" % (k,v) )
+    :modeOff: channel in sweep/modulation/burst mode, leave it first
+    """
+    recorder = KeyRecorder( panelState, trackMenu, outputs )
+    if modeOff:
+        recorder.ilModeOff( ch )
+    if arbFile is None:
+        recorder.ilGenerate( ch, wave, sameWave, dict(changes) )
     else:
-        print( "*No parameters*")
-    print( "" )
-    print( "Notice:")
-    print( "- parameters MUST be given in the order listed above")
-    print( "- parameters are optional and they MAY be left out")
-
-def cmdHelp( command=None ):
-    if command is None or not command:
-        mainMenuHelp(mainMenu)
-    else:
-        subMenuHelp( command, menuText=mainMenu[command], subMenu=subMenu[command] )
-        
-    
-def invalid( msg):
-    print( msg )
-    
-# def listResources():
-#      rm = pyvisa.ResourceManager()
-#      print( rm.list_resources() )
-#      rm.close()
-
-def promptValue( prompt, key=None, cmds=None, validValues=None ):
-    ans = None
-    if cmds is None:
-        # ans <- interactive
-        ans = input( "{} > ".format(prompt) )
-    else:
-        if len(cmds ) > 0:
-            # ans <- batch
-            if key is None:
-                # not expecting key-value pair - take first
-                ans = cmds.pop(0)
-            else:
-                # expecting key=value
-                peek1st = cmds[0]
-                match = re.search( r"(?P<key>.+)=(?P<value>.*)", peek1st )
-                if match is not None:
-                    # key-value pair found
-                    if match.group('key') == key:
-                        # key matches
-                        cmds.pop(0)
-                        ans = match.group('value')
-                    else:
-                        # key does not match
-                        ans = None
-                else:
-                    # no key-value pair (when expecting one)
-                    ans = None
-
-
-
-    # ans found - lets check validity
-    if validValues is not None:
-        if ans not in  validValues:
-            print( "{} > expecting one of {} - got '{}'".format( prompt, validValues, ans  ))
-            return None
-    return ans 
-
-# ------------------------------------------------------------------
-# State && access state
-gSgen = None
-
-def sgen():
-    global gSgen
-    if gSgen is None:
-        logging.info( "Opening gSgen" )
-        gSgen = UTG962( addr = FLAGS.addr )
-    return gSgen
-
-
-# ------------------------------------------------------------------
-def main(_argv):
-    
-    global gSgen
-    
-    logging.set_verbosity(FLAGS.debug)
-    cmds = None
-    if len(_argv) > 1:
-        cmds = _argv[1:]
-    logging.info( "Starting cmds={}".format(cmds))
-
-    goon = True
-    while goon:
-        if cmds is not None and len(cmds) == 0:
-            # all commands consumed - quit batch
-            break
-        cmd = promptValue( "Command [q=quit,?=help]", cmds=cmds, validValues=mainMenu.keys() )
-        logging.debug( "Command '{}'".format(cmd))
-        if cmd is None:
-            continue
-        elif cmd == 'q' or cmd == 'Q':
-            goon = False
-        elif cmd =='?':
-            if cmds is None:
-                cmdHelp()
-            else:
-                propVals = {
-                    k: promptValue(v,key=k,cmds=cmds) for k,v in helpProps.items()
-                }
-                cmdHelp( **propVals )
-        elif cmd == 'list':
-            listResources()
-        elif cmd == 'on':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in onOffProps.items()
-            }
-            sgen().on(**propVals)
-        elif cmd == 'off':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in onOffProps.items()
-            }
-            sgen().off(**propVals)
-        elif cmd == 'sine':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in sineProps.items()
-            }
-            logging.info( "sine: propVals:{}".format(propVals))
-            sgen().generate( wave="sine", **propVals )
-        elif cmd == 'arb':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in arbProps.items()
-            }
-            logging.info( "arb: propVals:{}".format(propVals))
-            sgen().arbGenerate( wave="arb", **propVals )
-        elif cmd == 'pulse':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in pulseProps.items()
-            }
-            logging.info( "pulse: propVals:{}".format(propVals))
-            sgen().generate( wave="pulse", **propVals )
-        elif cmd == 'square':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in squareProps.items()
-            }
-            logging.info( "square: propVals:{}".format(propVals))
-            sgen().generate( wave="square", **propVals )
-        elif cmd == 'reset':
-            sgen().reset()
-        elif cmd == 'list_resources':
-            resourses = list_resources()
-            if len(resourses) == 1:
-                print( resourses[0] )
-            else:
-                print( resourses )
-        elif cmd == 'version':
-            print( version())
-        elif cmd == 'screen':
-            propVals = {
-                k: promptValue(v,key=k,cmds=cmds) for k,v in screenCaptureProps.items()
-            }
-            sgen().screenShot(captureDir=FLAGS.captureDir, **propVals )
-    
-    # sgen = 
+        recorder.ilArbGenerate( ch, wave, arbFile[0], arbFile[1], sameWave, dict(changes) )
+    return recorder.recordedPlan()
 
-    # Close if not opened
-    if gSgen is not None:
-        logging.info( "Closing gSgen" )
-        gSgen.close()
-        gSgen = None
 
-    logging.info( "done" )
-    
+@lru_cache( maxsize=PLAN_CACHE_SIZE )
+def compileConfigure( panelState, trackMenu, outputs, entries ):
+    """Compile configure() to KeyPlan
 
+    :entries: tuple of (ch, wave, sameWave, changes, modeOff), 'changes'
+    tuple of (paramName, (value,unit)) -pairs
+    """
+    recorder = KeyRecorder( panelState, trackMenu, outputs )
+    recorder.ilConfigure( [ ( ch, wave, sameWave, dict(changes), modeOff ) for ch, wave, sameWave, changes, modeOff in entries ] )
+    return recorder.recordedPlan()
 
 
-if __name__ == '__main__':
+@lru_cache( maxsize=PLAN_CACHE_SIZE )
+def parseValUnit( valUnitsStr ):
+    """Split e.g. '2kHz' to ('2', 'kHz')"""
+    match = VAL_UNIT_RE.search( valUnitsStr )
+    if match is None:
+          msg = "Could not extract unit value from '{}'".format( valUnitsStr )
+          logging.error(msg)
+          raise ValueError(msg)
+    return ( match.group('value'), match.group('unit') )
+
+
+def visa():
+    """pyvisa module, imported on first device access"""
+    return importlib.import_module( "pyvisa" )
+
+
+def ioErrors():
+    """Exceptions of failed resource I/O"""
+    try:
+        return ( OSError, visa().errors.VisaIOError, visa().errors.InvalidSession )
+    except ImportError:
+        return ( OSError, )
+
+
+def localModule( name ):
+    """Import module 'name' of this package (also when run as script)"""
+    if __package__:
+        return importlib.import_module( "{}.{}".format( __package__, name ))
+    return importlib.import_module( name )
+
+
+def uploadData( filePath ):
+    """Upload content of 'filePath': bsv -file as is, CSV -file encoded to bsv"""
+    if filePath.lower().endswith( ".csv"):
+        return localModule( "bsv" ).csvToBsv( filePath )
+    with open( filePath, mode="rb") as fh:
+        return fh.read()
+
+
+def fileDigest( filePath ):
+    """Content hash of 'filePath'"""
+    with open( filePath, mode="rb") as fh:
+        return hashlib.sha256( fh.read() ).hexdigest()
+
+
+def _digits( value ):
+    """Shortest plain decimal string of Decimal 'value'"""
+    digits = format( value, "f" )
+    if "." in digits:
+        digits = digits.rstrip( "0").rstrip( ".")
+    return "0" if digits in ( "", "-0") else digits
+
+
+@lru_cache( maxsize=PLAN_CACHE_SIZE )
+def encodeValue( value, unit, units ):
+    """Cheapest exact key presentation of 'value' 'unit'
+
+    Chooses unit (from 'units' in the same unit family as 'unit')
+    requiring least digit key presses, e.g. ('2000000', 'Hz') ->
+    ('2', 'MHz').
+
+    :value: number as string
+
+    :units: tuple of unit names accepted by the device
+
+    :return: (digits, unit)
+
+    :raise ValueError: unknown unit, or value not representable on
+    device (sign, resolution, range)
+    """
+    family = next( (f for f in UNIT_SCALES if unit in f), None)
+    if family is None or unit not in units:
+        msg = "Invalid unit '{}' for value '{}', valid units: {}".format( unit, value, units )
+        logging.error(msg)
+        raise ValueError(msg)
     try:
-        app.run(main)
-    except SystemExit:
-        pass
-    
+        base = Decimal( value ).scaleb( family[unit] )
+    except InvalidOperation:
+        base = None
+    baseUnit = next( u for u, e in family.items() if e == 0 )
+    if base is None or not base.is_finite() \
+       or ( base < 0 and baseUnit not in UNIT_SIGNED ) \
+       or base != base.quantize( Decimal(1).scaleb( UNIT_RESOLUTION[baseUnit] )):
+        msg = "Value '{}{}' can not be represented on device".format( value, unit )
+        logging.error(msg)
+        raise ValueError(msg)
+    if baseUnit in UNIT_RANGE:
+        lo, hi = UNIT_RANGE[baseUnit]
+        if not lo <= base <= hi:
+            msg = "Value '{}{}' out of device range {}..{}{}".format( value, unit, lo, hi, baseUnit )
+            logging.error(msg)
+            raise ValueError(msg)
+    best = None
+    for u in [unit] + [ u for u in family if u in units and u != unit ]:
+        digits = _digits( base.scaleb( -family[u] ))
+        if best is None or len(digits) < len(best[0]):
+            best = ( digits, u )
+    return best
 
+
+def sameValue( text, valUnit ):
+    """True if 'text' (e.g. '2.000kHz') is value (value,unit) 'valUnit'"""
+    match = VAL_UNIT_RE.fullmatch( text )
+    if match is None:
+        return False
+    value, unit = match.group('value'), match.group('unit')
+    family = next( (f for f in UNIT_SCALES if valUnit[1] in f), None)
+    if family is None or unit not in family:
+        return False
+    try:
+        return Decimal( value ).scaleb( family[unit] ) == Decimal( str(valUnit[0]) ).scaleb( family[valUnit[1]] )
+    except InvalidOperation:
+        return False
+
+
+def sweepValues( start, stop, points ):
+    """'points' evenly spaced values from 'start' to 'stop'
+
+    :start, stop: value strings in the same unit family, e.g. '1kHz', '10MHz'
+
+    :return: list of (value,unit) in family base unit, rounded to
+    device resolution
+    """
+    missing = [ name for name, v in ( ( "start", start ), ( "stop", stop )) if not v ]
+    if missing:
+        msg = "Sweep range needs {} (or give 'values')".format( " and ".join( "'{}'".format(m) for m in missing ))
+        logging.error(msg)
+        raise ValueError(msg)
+    (v0, u0), (v1, u1) = parseValUnit( start ), parseValUnit( stop )
+    family = next( (f for f in UNIT_SCALES if u0 in f), None)
+    if family is None or u1 not in family or points < 1:
+        msg = "Invalid sweep range '{}'..'{}' with {} points".format( start, stop, points )
+        logging.error(msg)
+        raise ValueError(msg)
+    baseUnit = next( u for u, e in family.items() if e == 0 )
+    first, last = Decimal( v0 ).scaleb( family[u0] ), Decimal( v1 ).scaleb( family[u1] )
+    if points == 1: return [ ( _digits( first ), baseUnit ) ]
+    resolution = Decimal(1).scaleb( UNIT_RESOLUTION[baseUnit] )
+    return [ ( _digits( ( first + ( last - first ) * i / ( points - 1 )).quantize( resolution )), baseUnit )
+             for i in range(points) ]
+
+
+def jitterStats( points ):
+    """Jitter (effective - scheduled, seconds) statistics of sweep points
+
+    First point starts the schedule and is not included.
+    """
+    jitter = [ p.effective - p.scheduled for p in points[1:] ]
+    if not jitter:
+        return { "n": 0 }
+    return {
+        "n": len(jitter),
+        "mean": statistics.mean( jitter ),
+        "stdev": statistics.pstdev( jitter ),
+        "min": min( jitter ),
+        "max": max( jitter ),
+    }
+
+
+def list_resources():
+    return UTG962.list_resources()
+
+
+if __name__ == '__main__':
+    # Command line interface in cli.py
+    localModule( "cli" ).run()
@@ -0,0 +1,7 @@
+"""
+Command line interface: python -m UTG900 [options] [commands and parameters]
+"""
+
+from .cli import run
+
+run()
@@ -0,0 +1,209 @@
+"""
+asyncio front end for UTG900 signal generators.
+
+`AsyncUTG962` wraps a `UTG962` and offers awaitable `generate`,
+`arbGenerate`, `on`, `off` and `screenShot`. Calls on one instrument
+are put to an ordered command queue and run one at a time, in the
+order they were awaited. Blocking VISA transfers run in a single I/O
+thread per instrument, pauses of compiled key plans are awaited with
+`asyncio.sleep` (without blocking the event loop), and screenshot
+encoding runs in the default executor.
+
+Usage:
+
+  sgen = await AsyncUTG962.open( addr="SIM" )
+  await asyncio.gather( sgen.generate( ch=1, wave="sine", freq="1kHz"), scope.arm())
+  await sgen.close()
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+try:
+    from .UTG900 import UTG962, ADDR, UploadStep, localModule
+except ImportError:
+    from UTG900 import UTG962, ADDR, UploadStep, localModule
+
+
+class AsyncUTG962:
+    """
+    Awaitable UTG962.
+
+    :sgen: UTG962 instance, used only via this object after wrapping
+
+    :io: single thread executor for blocking I/O, default: new one
+    """
+
+    def __init__( self, sgen, io=None ):
+        self.sgen = sgen
+        self.io = io if io is not None else ThreadPoolExecutor( max_workers=1, thread_name_prefix="utg900-io" )
+        self.queue = None
+        self.worker = None
+
+    @classmethod
+    async def open( cls, addr=ADDR, **kwargs ):
+        """Open (&& reset) UTG962 at 'addr' without blocking the event loop
+
+        :kwargs: passed to UTG962 constructor
+        """
+        io = ThreadPoolExecutor( max_workers=1, thread_name_prefix="utg900-io" )
+        sgen = await asyncio.get_running_loop().run_in_executor( io, partial( UTG962, addr=addr, **kwargs ))
+        return cls( sgen, io=io )
+
+    async def close( self ):
+        """Run queued commands, then close instrument"""
+        if self.worker is not None:
+            await self.queue.join()
+            self.worker.cancel()
+            self.worker = None
+        await self.ioCall( self.sgen.close )
+        self.io.shutdown()
+
+    async def __aenter__( self ):
+        return self
+
+    async def __aexit__( self, *exc ):
+        await self.close()
+
+    # Command queue
+    def submit( self, coro, *args ):
+        """Queue coroutine function 'coro' to run after previously queued commands
+
+        :return: future for the result of coro(*args)
+        """
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task( self.runQueue() )
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait( (fut, coro, args) )
+        return fut
+
+    async def runQueue( self ):
+        while True:
+            fut, coro, args = await self.queue.get()
+            try:
+                if not fut.cancelled():
+                    result = await coro( *args )
+                    if not fut.cancelled(): fut.set_result( result )
+            except asyncio.CancelledError:
+                fut.cancel()
+                raise
+            except Exception as err:
+                if not fut.cancelled(): fut.set_exception( err )
+            finally:
+                self.queue.task_done()
+
+    def ioCall( self, fn, *args ):
+        """Run blocking 'fn' in the I/O thread of this instrument"""
+        return asyncio.get_running_loop().run_in_executor( self.io, partial( fn, *args ))
+
+    # Plan execution
+    async def runPlan( self, plan ):
+        """Execute compiled key plan, pauses without blocking"""
+        sgen = self.sgen
+        try:
+            keys = []
+            for step in plan.steps:
+                if isinstance( step, str):
+                    keys.append( step )
+                    continue
+                if keys:
+                    await self.ioCall( self.sendAll, keys )
+                    keys = []
+                if isinstance( step, UploadStep ):
+                    await self.ioCall( sgen.ilUpload, step.filePath )
+                else:
+                    await self.pause( step )
+            if keys:
+                await self.ioCall( self.sendAll, keys )
+            await self.ioCall( sgen.flush )
+        except:
+            sgen.panel = None
+            raise
+        sgen.panel = plan.panel
+        sgen.ch = list( plan.ch )
+
+    def sendAll( self, cmds ):
+        for cmd in cmds:
+            self.sgen.sendStep( cmd )
+
+    async def pause( self, secs ):
+        """Async UTG962.pause"""
+        await self.ioCall( self.sgen.flush )
+        if self.sgen.pollReady:
+            await self.ioCall( self.sgen.waitReady, secs )
+        else:
+            await asyncio.sleep( secs )
+
+    async def runShadowPlan( self, ch, wave, changes, plan ):
+        shadow = self.sgen.shadow[ch-1]
+        try:
+            await self.runPlan( plan )
+        except:
+            # Device state unknown
+            shadow.clear()
+            raise
+        shadow["wave"] = wave
+        shadow.update( changes )
+        shadow.pop( "mode", None )
+        if self.sgen.verify:
+            await self.ioCall( self.sgen.checkScreen, [ch] )
+
+    # API
+    def generate( self, ch=1, wave="sine", force=False, **params ):
+        """Awaitable UTG962.generate (freq, amp, offset, phase, duty, raised, fall)"""
+        return self.submit( self._generate, int(ch), wave, force, params )
+
+    async def _generate( self, ch, wave, force, params ):
+        changes, plan = self.sgen.generatePlan( ch, wave, force=force, **params )
+        await self.runShadowPlan( ch, wave, changes, plan )
+
+    def arbGenerate( self, ch=1, wave="arb", filePath="tmp/apu.csv", fileName="ARB", force=False, **params ):
+        """Awaitable UTG962.arbGenerate (freq, amp, offset, phase)"""
+        return self.submit( self._arbGenerate, int(ch), wave, filePath, fileName, force, params )
+
+    async def _arbGenerate( self, ch, wave, filePath, fileName, force, params ):
+        # File digest reads the file: not in event loop
+        changes, plan, arbFile = await asyncio.get_running_loop().run_in_executor(
+            None, partial( self.sgen.arbGeneratePlan, ch, wave, filePath, fileName, force=force, **params ))
+        await self.runShadowPlan( ch, wave, changes, plan )
+        self.sgen.shadow[ch-1]["file"] = arbFile
+
+    def on( self, ch ):
+        """Awaitable UTG962.on"""
+        return self.submit( self._output, int(ch), True )
+
+    def off( self, ch ):
+        """Awaitable UTG962.off"""
+        return self.submit( self._output, int(ch), False )
+
+    async def _output( self, ch, state ):
+        await self.runPlan( self.sgen.outputPlan( ch, state ))
+
+    def screenShot( self, captureDir, fileName=None, ext="png" ):
+        """Awaitable UTG962.screenShot
+
+        Capture is queued like other commands, image is encoded in
+        the default executor while following commands run.
+
+        :return: file path written
+        """
+        if fileName is None:
+            now = datetime.now()
+            fileName = "UTG-{}.{}".format( now.strftime("%Y%m%d-%H%M%S"), ext )
+        filePath = os.path.join( captureDir, fileName )
+        capture = self.submit( self._capture )
+        return asyncio.ensure_future( self._encode( capture, filePath ))
+
+    async def _capture( self ):
+        data = await self.ioCall( self.sgen.llSShot )
+        await self.ioCall( self.sgen.llOpen )
+        return data
+
+    async def _encode( self, capture, filePath ):
+        data = await capture
+        dib = localModule( "dib" )
+        return await asyncio.get_running_loop().run_in_executor( None, dib.writeImage, data, filePath )
@@ -0,0 +1,102 @@
+"""
+UTG900 arbitrary waveform (.bsv) encoder.
+
+Encodes samples, given as NumPy array or as UTG900 CSV export (see
+data/simplewave.csv), to the binary .bsv format uploaded by
+`UTG962.arbGenerate` (see data/simplewave.bsv):
+
+  [HEAD]:<length of header lines>
+  VPP, OFFSET, CHANNEL, RATEPOS, RATENEG, MAX, MIN -lines
+  [DATA]:<number of samples>
+  <samples as little endian int16>
+
+Header lines are separated with CR LF. Samples are scaled around
+their midpoint so that the peak to peak range maps to -SAMPLE_MAX ..
+SAMPLE_MAX: full scale codes are always +-VPP/2 around OFFSET.
+"""
+
+import numpy as np
+
+SAMPLE_MAX = 32767
+
+
+def bsvBytes( samples, vpp=None, offset=None, channel=1 ):
+    """Encode 'samples' to .bsv file content
+
+    :samples: sequence/array of sample values (waveform shape)
+
+    :vpp: peak to peak voltage, default: peak to peak of 'samples'
+
+    :offset: offset voltage, default: midpoint of 'samples'
+
+    :channel: channel number written to header
+    """
+    x = np.asarray( samples, dtype=np.float64 ).ravel()
+    if x.size == 0:
+        raise ValueError( "No samples to encode")
+    lo, hi = float( x.min()), float( x.max())
+    mid, pp = ( hi + lo ) / 2, hi - lo
+    if vpp is None: vpp = pp
+    if offset is None: offset = mid
+    if pp > 0:
+        data = np.rint( ( x - mid ) * ( 2 * SAMPLE_MAX / pp )).astype( "<i2")
+    else:
+        # Constant (DC) input: all codes at midscale, level is OFFSET
+        data = np.zeros( x.size, dtype="<i2")
+    head = "".join( "{}\r\n".format(l) for l in [
+        "VPP:{:f}".format( vpp ),
+        "OFFSET:{:f}".format( offset ),
+        "CHANNEL:{:d}".format( int(channel) ),
+        "RATEPOS:{:f}".format( 1.0 / SAMPLE_MAX ),
+        "RATENEG:{:f}".format( 1.0 / SAMPLE_MAX ),
+        "MAX:{:f}".format( SAMPLE_MAX ),
+        "MIN:{:f}".format( -SAMPLE_MAX ),
+    ])
+    header = "[HEAD]:{}\r\n{}[DATA]:{}\r\n".format( len(head), head, data.size )
+    return header.encode( "ascii") + data.tobytes()
+
+
+def readCsv( fh ):
+    """Read UTG900 CSV export (or plain one value per line CSV)
+
+    :fh: file path or text file object
+
+    :return: (samples as NumPy array, header dict)
+    """
+    if isinstance( fh, str ):
+        with open( fh, "r") as f:
+            return readCsv( f )
+    header = {}
+    values = []
+    inHead = False
+    for line in fh:
+        line = line.strip()
+        if not line: continue
+        if line.startswith( "[HEAD]"):
+            inHead = True
+            continue
+        if line.startswith( "[DATA]"):
+            inHead = False
+            continue
+        if inHead:
+            key, _, val = line.partition( ":")
+            header[key.strip().upper()] = val.strip()
+            continue
+        # Sample value is the last non empty field (e.g. '1.015777,' or '1,0.2')
+        values.append( line.rstrip( ",").rsplit( ",", 1)[-1] )
+    return np.array( values, dtype=np.float64 ), header
+
+
+def csvToBsv( fh, vpp=None, offset=None, channel=None ):
+    """Encode CSV file to .bsv file content
+
+    VPP, OFFSET and CHANNEL default to values in CSV [HEAD] -section
+    (VPP && OFFSET then to peak to peak && midpoint of samples).
+
+    :fh: file path or text file object
+    """
+    samples, header = readCsv( fh )
+    if vpp is None and "VPP" in header: vpp = float( header["VPP"] )
+    if offset is None and "OFFSET" in header: offset = float( header["OFFSET"] )
+    if channel is None: channel = int( header.get( "CHANNEL", 1))
+    return bsvBytes( samples, vpp=vpp, offset=offset, channel=channel )
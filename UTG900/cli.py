@@ -0,0 +1,512 @@
+"""
+Command line interface of UTG900.py
+
+Flags and command menus live here, apart from the importable UTG962
+library, so that 'import UTG900' defines no flags and does not touch
+VISA. The VISA resource manager is created on first device access
+only: 'UTG900.py version' and '? command=...' never open it.
+"""
+
+import re
+import sys
+from absl import app, flags, logging
+from absl.flags import FLAGS
+
+try:
+    from .UTG900 import ADDR, UTG962, version, list_resources, localModule, sweepValues, jitterStats
+except ImportError:
+    from UTG900 import ADDR, UTG962, version, list_resources, localModule, sweepValues, jitterStats
+
+flags.DEFINE_integer('debug', -1, '-3=fatal, -1=warning, 0=info, 1=debug')
+flags.DEFINE_string('addr', ADDR, "UTG900 pyvisa resource address ('SIM' for simulated UTG900, 'REPLAY:<file>' for recorded trace)")
+flags.DEFINE_string('captureDir', "pics", "Capture directory")
+flags.DEFINE_integer('batch', 0, 'Max number of key presses coalesced into one write (0=no batching)')
+flags.DEFINE_boolean('pollReady', False, 'Poll *OPC? for readiness instead of fixed sleeps')
+flags.DEFINE_boolean('trackMenu', False, 'Trust tracked menu state between commands (nobody touches the front panel)')
+flags.DEFINE_boolean('reset', True, 'Reset (*RST) device when connecting, --noreset keeps its configuration (outputs assumed off)')
+flags.DEFINE_integer('retries', 0, 'Retry failed device I/O this many times, reopening connection with exponential backoff')
+flags.DEFINE_integer('timeout', None, 'Device I/O timeout (ms), default VISA timeout')
+flags.DEFINE_boolean('verify', False, 'Check values shown on screen after each sine/square/pulse/arb command (requires numpy, --templates unless --addr SIM)')
+flags.DEFINE_string('templates', None, 'Glyph template set calibrated for device screen (see UTG962.calibrateScreen)')
+flags.DEFINE_boolean('simultaneous', False, 'Configure consecutive sine/square/pulse commands for CH1 && CH2 in one pass, outputs on back to back')
+
+flags.DEFINE_string('script', None, 'Command script file (one command per line), validated && compiled before run')
+flags.DEFINE_boolean('dryRun', False, 'Validate commands (and --script), print key plans && cost estimate, no device access')
+flags.DEFINE_string('record', None, "Record VISA traffic to trace file (.gz compressed), replay with --addr 'REPLAY:<file>'")
+flags.DEFINE_string('metrics', None, 'Instrument device calls, write per command latency/writes/bytes to this file (.json = JSON, else Prometheus text)')
+flags.DEFINE_string('serve', None, 'Run session daemon on this Unix socket, keeps UTG900 sessions open between commands')
+flags.DEFINE_string('session', None, 'Forward commands (and --script, validated here) to session daemon on this Unix socket, device never opened locally (see --serve)')
+
+CMD="UTG900.py"
+
+# ------------------------------------------------------------------
+# State && Global
+helpProps = {
+    "command" : "show help for command",
+}
+
+onOffProps  = {
+    'ch'    :   "Channel 1,2 to switch on/off",    
+}
+
+screenCaptureProps  = {
+    'fileName'   :   "Screen capture file name (optional)",    
+    'count'      :   "Number of screen captures in burst (optional)",
+    'interval'   :   "Seconds between burst captures (optional)",
+}
+
+sineProps = onOffProps | {
+    'freq'  :   "Frequency [uHz|mHz|Hz|kHz|MHz]",
+    'amp'   :    "Amplitude [mVpp|Vpp|mVrms|Vrms]",
+    'offset': "Offset [mV|V]",
+    'phase' :  "Phase [deg]",
+}
+        
+arbProps = sineProps | {
+    'filePath'  :   "Path to waveform file (.bsv, or .csv converted to bsv)",
+    'fileName'  :   "Name of the file on UTG900",
+}
+        
+squareProps = sineProps | {
+    'duty'  :   "Duty [%]",
+}
+        
+pulseProps = squareProps | {
+    'raised':   "Raise [ns,us,ms,s,ks]",
+    'fall'  :     "Fall [ns,us,ms,s,ks]",
+}
+
+# Commands collected by --simultaneous
+GENERATE_CMDS = ( 'sine', 'square', 'pulse' )
+
+sweepProps = onOffProps | {
+    'wave'  :   "Wave [sine|square|pulse], default sine",
+    'field' :   "Swept field [freq|amp|offset|phase|duty], default freq",
+    'values':   "Comma separated values (e.g. 1kHz,2kHz,5kHz), or use start/stop/points",
+    'start' :   "First value of range",
+    'stop'  :   "Last value of range",
+    'points':   "Number of points in range, default 2",
+    'dwell' :   "Seconds to hold each point, default 1",
+}
+
+devSweepProps = onOffProps | {
+    'start' :   "Start frequency [uHz|mHz|Hz|kHz|MHz]",
+    'stop'  :   "Stop frequency [uHz|mHz|Hz|kHz|MHz]",
+    'time'  :   "Sweep time [ns,us,ms,s,ks]",
+}
+
+amProps = onOffProps | {
+    'freq'  :   "Modulating frequency [uHz|mHz|Hz|kHz|MHz]",
+    'depth' :   "Modulation depth [%]",
+}
+
+fmProps = onOffProps | {
+    'freq'  :   "Modulating frequency [uHz|mHz|Hz|kHz|MHz]",
+    'dev'   :   "Frequency deviation [uHz|mHz|Hz|kHz|MHz]",
+}
+
+pmProps = onOffProps | {
+    'freq'  :   "Modulating frequency [uHz|mHz|Hz|kHz|MHz]",
+    'dev'   :   "Phase deviation [deg]",
+}
+
+burstProps = onOffProps | {
+    'count' :   "Number of cycles in burst",
+    'period':   "Burst period [ns,us,ms,s,ks]",
+}
+
+subMenu = {
+    "sine"            : sineProps,
+    "square"          : squareProps,
+    "pulse"           : pulseProps,
+    "arb"             : arbProps,    
+    "on"              : onOffProps,
+    "off"             : onOffProps,
+    "screen"          :  screenCaptureProps,
+    "sweep"           :  sweepProps,
+    "devsweep"        :  devSweepProps,
+    "am"              :  amProps,
+    "fm"              :  fmProps,
+    "pm"              :  pmProps,
+    "burst"           :  burstProps,
+    "modeoff"         :  onOffProps,
+    "reset"           :  {},
+    "list_resources"  :  {},
+    "version"         :  {},
+}
+
+
+mainMenu = {
+    'q'              : "Exit",
+    'Q'              : "Exit",
+    '?'              : "Usage help",
+    "sine"           : "Generate sine -wave on channel 1|2",
+    "square"         : "Generate square -wave on channel 1|2",
+    "pulse"          : "Generate pulse -wave on channel 1|2",
+    "arb"            : "Upload wave file and use it to generate wave on channel 1|2",
+    "on"             : "Switch on channel 1|2",
+    "off"            : "Switch off channel 1|2",
+    "reset"          : "Send reset to UTG900 signal generator",
+    "screen"         : "Take screenshot to 'captureDir'",
+    "sweep"          : "Step one parameter on channel 1|2, report timing jitter",
+    "devsweep"       : "Device side frequency sweep on channel 1|2",
+    "am"             : "Amplitude modulation on channel 1|2",
+    "fm"             : "Frequency modulation on channel 1|2",
+    "pm"             : "Phase modulation on channel 1|2",
+    "burst"          : "Burst mode on channel 1|2",
+    "modeoff"        : "Leave sweep/modulation/burst mode on channel 1|2",
+    "list_resources" : "List pyvisa resources (=pyvisa list_resources() wrapper)'",
+    "version"        : "Output version number",
+}
+
+
+
+# ------------------------------------------------------------------
+def mainMenuHelp(mainMenu):
+    print( "{} - {}: Tool to control UNIT-T UTG900 Waveform generator".format(CMD, version()) )
+    print( "" )
+    print( "Usage: {} [options] [commands and parameters] ".format( CMD ))
+    print( "" )
+    print( "Commands:")
+    for k,v in mainMenu.items():
+        print( "%15s  : %s" % (k,v) )
+    print( "" )
+    print( "More help:")
+    print( "  {} --help                          : to list options".format(CMD) )
+    print( "  {} ? command=<command>             : to get help on command <command> parameters".format(CMD) )
+    print( "")
+    print( "Examples:")
+    print( "  {}                                 : start interactive mode".format(CMD))
+    print( "  {} ? command=sine                  : help on sine command parameters".format(CMD))
+    print( "  {} list_resources                  : Identify --addr option parameter".format(CMD))
+    print( "  {} --addr 'USB0::1::2::3::0::INSTR': Run interactively on device found in --addr 'USB0::1::2::3::0::INSTR'".format(CMD))
+    print( "  {} --addr SIM sine ch=1 freq=2kHz  : Run against simulated UTG900 (no hardware needed)".format(CMD))
+    print( "  {} --script recipe.txt --dryRun    : Validate script, print key plans && cost without device".format(CMD))
+    print( "  {} --serve /tmp/utg900.sock        : Keep session open in daemon (no *RST per invocation)".format(CMD))
+    print( "  {} --session /tmp/utg900.sock on ch=1 : Run command in daemon session".format(CMD))
+    print( "  {} --captureDir=pics screen        : Take screenshot to pics directory (form device in default --addr)".format(CMD))
+    print( "  {} reset                           : Send reset to UTH900 waveform generator".format(CMD))    
+    print( "  {} sine ch=2 freq=2kHz             : Generate 2 kHz sine signal on channel 2".format(CMD))
+    print( "  {} sine ch=1 square ch=2           : chaining sine generation on channel 1, and square generation on channel 2".format(CMD))
+    
+    print( "")
+    print( "Hint:")
+    print( "  One-liner in linux: {} --addr $({} list_resources)".format(CMD, CMD))
+    
+
+def subMenuHelp( command, menuText, subMenu ):
+    print( "{} - {}".format( command, menuText))
+    print( "" )
+    if len(subMenu.keys()) > 0:
+       for k,v in subMenu.items():
+           print( "%10s  : %s" % (k,v) )
+    else:
+        print( "*No parameters*")
+    print( "" )
+    print( "Notice:")
+    print( "- parameters MUST be given in the order listed above")
+    print( "- parameters are optional and they MAY be left out")
+
+def cmdHelp( command=None ):
+    if command is None or not command:
+        mainMenuHelp(mainMenu)
+    else:
+        subMenuHelp( command, menuText=mainMenu[command], subMenu=subMenu[command] )
+        
+    
+def invalid( msg):
+    print( msg )
+    
+def promptValue( prompt, key=None, cmds=None, validValues=None ):
+    ans = None
+    if cmds is None:
+        # ans <- interactive
+        ans = input( "{} > ".format(prompt) )
+    else:
+        if len(cmds ) > 0:
+            # ans <- batch
+            if key is None:
+                # not expecting key-value pair - take first
+                ans = cmds.pop(0)
+            else:
+                # expecting key=value
+                peek1st = cmds[0]
+                match = re.search( r"(?P<key>.+)=(?P<value>.*)", peek1st )
+                if match is not None:
+                    # key-value pair found
+                    if match.group('key') == key:
+                        # key matches
+                        cmds.pop(0)
+                        ans = match.group('value')
+                    else:
+                        # key does not match
+                        ans = None
+                else:
+                    # no key-value pair (when expecting one)
+                    ans = None
+
+
+
+    # ans found - lets check validity
+    if validValues is not None:
+        if ans not in  validValues:
+            print( "{} > expecting one of {} - got '{}'".format( prompt, validValues, ans  ))
+            return None
+    return ans 
+
+# ------------------------------------------------------------------
+# State && access state
+gSgen = None
+gMetrics = None
+
+def sgen():
+    global gSgen
+    if gSgen is None:
+        logging.info( "Opening gSgen" )
+        gSgen = UTG962( addr = FLAGS.addr, batch = FLAGS.batch, pollReady = FLAGS.pollReady, trackMenu = FLAGS.trackMenu, record = FLAGS.record,
+                        reset = FLAGS.reset, retries = FLAGS.retries, timeout = FLAGS.timeout, verify = FLAGS.verify, templates = FLAGS.templates )
+        if FLAGS.metrics:
+            global gMetrics
+            gMetrics = localModule( "metrics" ).Metrics()
+            gMetrics.attach( gSgen )
+    return gSgen
+
+
+def scriptCommands( cmds ):
+    """Commands parsed from --script && command line 'cmds', exit on errors"""
+    script = localModule( "script" )
+    commands, errors = [], []
+    if FLAGS.script:
+        with open( FLAGS.script, "r") as fh:
+            commands, errors = script.parseScript( fh, subMenu )
+    argCommands, argErrors = script.parseTokens( cmds or [], subMenu )
+    commands += argCommands
+    errors += argErrors
+    if errors:
+        logging.error( "Script not valid:\n  " + "\n  ".join( errors ))
+        sys.exit(1)
+    return commands
+
+
+# ------------------------------------------------------------------
+def main(_argv):
+    
+    global gSgen
+    
+    logging.set_verbosity(FLAGS.debug)
+    cmds = None
+    if len(_argv) > 1:
+        cmds = _argv[1:]
+    logging.info( "Starting cmds={}".format(cmds))
+
+    if FLAGS.serve:
+        try:
+            daemon = localModule( "daemon" )
+            daemon.removeStaleSocket( FLAGS.serve )
+        except ValueError:
+            sys.exit(1)
+        daemon.serve( FLAGS.serve, runCommands, batch = FLAGS.batch, pollReady = FLAGS.pollReady, trackMenu = FLAGS.trackMenu,
+                                      reset = FLAGS.reset, retries = FLAGS.retries, timeout = FLAGS.timeout, verify = FLAGS.verify, templates = FLAGS.templates )
+        return
+    if FLAGS.session and not FLAGS.dryRun:
+        # Session daemon holds the device: forward, never open it here
+        if FLAGS.script:
+            # Validate script here, run it in daemon
+            script = localModule( "script" )
+            commands = scriptCommands( cmds )
+            try:
+                script.compileScript( commands, subMenu, runCommands, FLAGS.captureDir, trackMenu = FLAGS.trackMenu )
+            except ValueError:
+                sys.exit(1)
+            cmds = [ token for command in commands for token in script.commandTokens( command, subMenu ) ]
+        if not cmds:
+            logging.error( "--session {}: no commands to forward (interactive prompt runs without --session)".format( FLAGS.session ))
+            sys.exit(1)
+        ok = localModule( "daemon" ).forward( FLAGS.session, cmds, addr = FLAGS.addr, captureDir = FLAGS.captureDir )
+        if not ok: sys.exit(1)
+        return
+
+    if FLAGS.script or FLAGS.dryRun:
+        # Compile && validate everything before sending anything
+        script = localModule( "script" )
+        commands = scriptCommands( cmds )
+        try:
+            if FLAGS.dryRun:
+                program = script.compileScript( commands, subMenu, runCommands, FLAGS.captureDir, trackMenu = FLAGS.trackMenu )
+                script.printProgram( program, batch = FLAGS.batch )
+                return
+            if FLAGS.reset:
+                # Opening device resets it, validate without device first
+                script.compileScript( commands, subMenu, runCommands, FLAGS.captureDir, trackMenu = FLAGS.trackMenu )
+            program = script.compileScript( commands, subMenu, runCommands, FLAGS.captureDir, sgen = sgen() )
+        except ValueError:
+            # Errors logged by compileScript
+            sys.exit(1)
+        script.runProgram( program, sgen(), runCommands, FLAGS.captureDir )
+    else:
+        runCommands( cmds, sgen, FLAGS.captureDir, simultaneous = FLAGS.simultaneous )
+
+    # Close if not opened
+    if gSgen is not None:
+        logging.info( "Closing gSgen" )
+        gSgen.close()
+        gSgen = None
+    if gMetrics is not None:
+        logging.info( "Writing metrics to {}".format(FLAGS.metrics))
+        gMetrics.write( FLAGS.metrics )
+
+    logging.info( "done" )
+
+
+def runCommands( cmds, sgen, captureDir, simultaneous=False ):
+    """Run command line 'cmds' (None = interactive prompt)
+
+    :sgen: function returning UTG962 to use, called only when
+    command needs device
+
+    :captureDir: directory for screen captures
+
+    :simultaneous: collect consecutive sine/square/pulse commands
+    for different channels && configure them in one pass
+    """
+    pending = []
+    def flush():
+        if pending:
+            sgen().configure( list(pending) )
+            pending.clear()
+    def generate( wave, propVals ):
+        if not simultaneous:
+            sgen().generate( wave=wave, **propVals )
+            return
+        if any( int(p["ch"] or 1) == int(propVals["ch"] or 1) for p in pending ):
+            flush()
+        pending.append( dict( propVals, wave=wave ))
+
+    goon = True
+    while goon:
+        if cmds is not None and len(cmds) == 0:
+            # all commands consumed - quit batch
+            break
+        cmd = promptValue( "Command [q=quit,?=help]", cmds=cmds, validValues=mainMenu.keys() )
+        logging.debug( "Command '{}'".format(cmd))
+        if cmd not in GENERATE_CMDS:
+            flush()
+        if cmd is None:
+            continue
+        elif cmd == 'q' or cmd == 'Q':
+            goon = False
+        elif cmd =='?':
+            if cmds is None:
+                cmdHelp()
+            else:
+                propVals = {
+                    k: promptValue(v,key=k,cmds=cmds) for k,v in helpProps.items()
+                }
+                cmdHelp( **propVals )
+        elif cmd == 'list':
+            listResources()
+        elif cmd == 'on':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in onOffProps.items()
+            }
+            sgen().on(**propVals)
+        elif cmd == 'off':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in onOffProps.items()
+            }
+            sgen().off(**propVals)
+        elif cmd == 'sine':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in sineProps.items()
+            }
+            logging.info( "sine: propVals:{}".format(propVals))
+            generate( "sine", propVals )
+        elif cmd == 'arb':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in arbProps.items()
+            }
+            logging.info( "arb: propVals:{}".format(propVals))
+            sgen().arbGenerate( wave="arb", **propVals )
+        elif cmd == 'pulse':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in pulseProps.items()
+            }
+            logging.info( "pulse: propVals:{}".format(propVals))
+            generate( "pulse", propVals )
+        elif cmd == 'square':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in squareProps.items()
+            }
+            logging.info( "square: propVals:{}".format(propVals))
+            generate( "square", propVals )
+        elif cmd == 'sweep':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in sweepProps.items()
+            }
+            logging.info( "sweep: propVals:{}".format(propVals))
+            if propVals["values"]:
+                values = propVals["values"].split( ",")
+            else:
+                values = sweepValues( propVals["start"], propVals["stop"], int(propVals["points"] or 2) )
+            points = sgen().sweep( ch=propVals["ch"] or 1, wave=propVals["wave"] or "sine", field=propVals["field"] or "freq",
+                                   values=values, dwell=float(propVals["dwell"] or 1) )
+            stats = jitterStats( points )
+            print( "sweep: {} points, jitter{}".format( len(points), "".join(
+                " {}={:.3f}ms".format( k, 1000*v) for k, v in stats.items() if k != "n" )))
+        elif cmd == 'devsweep':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in devSweepProps.items()
+            }
+            logging.info( "devsweep: propVals:{}".format(propVals))
+            sgen().deviceSweep( **propVals )
+        elif cmd in ( 'am', 'fm', 'pm' ):
+            props = { 'am': amProps, 'fm': fmProps, 'pm': pmProps }[cmd]
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in props.items()
+            }
+            logging.info( "{}: propVals:{}".format(cmd, propVals))
+            sgen().modulate( mode=cmd, **propVals )
+        elif cmd == 'burst':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in burstProps.items()
+            }
+            logging.info( "burst: propVals:{}".format(propVals))
+            sgen().burst( **propVals )
+        elif cmd == 'modeoff':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in onOffProps.items()
+            }
+            sgen().modeOff( **propVals )
+        elif cmd == 'reset':
+            sgen().reset()
+        elif cmd == 'list_resources':
+            resourses = list_resources()
+            if len(resourses) == 1:
+                print( resourses[0] )
+            else:
+                print( resourses )
+        elif cmd == 'version':
+            print( version())
+        elif cmd == 'screen':
+            propVals = {
+                k: promptValue(v,key=k,cmds=cmds) for k,v in screenCaptureProps.items()
+            }
+            count = propVals.pop( "count" )
+            interval = propVals.pop( "interval" )
+            if count:
+                sgen().screenBurst(captureDir=captureDir, count=int(count), interval=float(interval or 0), **propVals )
+            else:
+                sgen().screenShot(captureDir=captureDir, **propVals )
+    flush()
+
+
+def run():
+    try:
+        app.run(main)
+    except SystemExit as err:
+        # Keep failure exit status (e.g. failed --session command)
+        if err.code: raise
+
+
+if __name__ == '__main__':
+    run()
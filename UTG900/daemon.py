@@ -0,0 +1,160 @@
+"""
+UTG900 session daemon.
+
+`UTG900.py --serve <socket>` keeps UTG962 sessions open on a Unix
+socket: the device is opened (and reset) once, on first command for
+its address, and later commands continue from the known state
+(shadow, channel outputs). `UTG900.py --session <socket> <commands>`
+forwards command line commands to the daemon instead of opening the
+device.
+
+Protocol: one JSON line per connection each way,
+
+  request:  {"cmds": [...], "addr": ..., "captureDir": ..., "cwd": ...}
+  response: {"ok": true|false, "output": <printed text>, "error": ...}
+
+Requests are served one at a time.
+"""
+
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+from contextlib import redirect_stdout
+
+from absl import logging
+
+try:
+    from .UTG900 import UTG962, ADDR
+except ImportError:
+    from UTG900 import UTG962, ADDR
+
+
+class SessionServer( socketserver.UnixStreamServer ):
+    """
+    Unix socket server holding UTG962 sessions by address.
+
+    :runCommands: function( cmds, sgen, captureDir ) running command
+    line commands (see cli.runCommands)
+
+    :kwargs: passed to UTG962 constructor when opening session
+    """
+
+    def __init__( self, socketPath, runCommands, **kwargs ):
+        self.runCommands = runCommands
+        self.sgenArgs = kwargs
+        self.sessions = {}
+        super().__init__( socketPath, SessionHandler )
+
+    def session( self, addr ):
+        """UTG962 for 'addr', opened on first use"""
+        if addr not in self.sessions:
+            logging.info( "Opening session {}".format(addr))
+            self.sessions[addr] = UTG962( addr=addr, **self.sgenArgs )
+        return self.sessions[addr]
+
+    def execute( self, req ):
+        addr = req.get( "addr") or ADDR
+        out = io.StringIO()
+        cwd = os.getcwd()
+        try:
+            # Relative paths (e.g. arb filePath) as seen by client
+            os.chdir( req.get( "cwd") or cwd )
+            with redirect_stdout( out ):
+                self.runCommands( list(req["cmds"]), lambda: self.session( addr ), req.get( "captureDir") )
+            return { "ok": True, "output": out.getvalue() }
+        except Exception as err:
+            logging.error( "Session {} cmds={} failed: {}".format( addr, req.get( "cmds"), err ))
+            return { "ok": False, "output": out.getvalue(), "error": "{}: {}".format( type(err).__name__, err ) }
+        finally:
+            os.chdir( cwd )
+
+    def closeSessions( self ):
+        for addr, sgen in self.sessions.items():
+            logging.info( "Closing session {}".format(addr))
+            sgen.close()
+        self.sessions = {}
+
+
+class SessionHandler( socketserver.StreamRequestHandler ):
+    def handle( self ):
+        line = self.rfile.readline()
+        if not line:
+            # Connected && closed without request (e.g. removeStaleSocket probe)
+            return
+        try:
+            req = json.loads( line )
+        except ValueError as err:
+            resp = { "ok": False, "output": "", "error": "Invalid request: {}".format(err) }
+        else:
+            resp = self.server.execute( req )
+        self.wfile.write( ( json.dumps( resp ) + "\n" ).encode() )
+
+
+def removeStaleSocket( socketPath ):
+    """Remove socket of a daemon no longer running at 'socketPath'
+
+    :raise ValueError: 'socketPath' is not a socket, or a daemon is
+    listening on it
+    """
+    try:
+        mode = os.stat( socketPath ).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK( mode ):
+        msg = "'{}' exists and is not a socket".format( socketPath )
+        logging.error(msg)
+        raise ValueError(msg)
+    with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as sock:
+        try:
+            sock.connect( socketPath )
+        except ConnectionRefusedError:
+            # Stale socket of previous daemon
+            logging.info( "Removing stale socket {}".format(socketPath))
+            os.unlink( socketPath )
+            return
+    msg = "Daemon already serving on '{}'".format( socketPath )
+    logging.error(msg)
+    raise ValueError(msg)
+
+
+def serve( socketPath, runCommands, **kwargs ):
+    """Serve UTG962 sessions on 'socketPath' until interrupted or terminated"""
+    removeStaleSocket( socketPath )
+    server = SessionServer( socketPath, runCommands, **kwargs )
+    signal.signal( signal.SIGTERM, lambda *_: sys.exit(0) )
+    logging.warning( "Serving UTG900 sessions on {}".format(socketPath))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.closeSessions()
+        server.server_close()
+        os.unlink( socketPath )
+
+
+def forward( socketPath, cmds, addr=None, captureDir=None ):
+    """Run command line 'cmds' in daemon on 'socketPath', print output
+
+    :return: True if commands succeeded
+    """
+    req = {
+        "cmds": cmds,
+        "addr": addr,
+        "captureDir": os.path.abspath( captureDir ) if captureDir else None,
+        "cwd": os.getcwd(),
+    }
+    with socket.socket( socket.AF_UNIX, socket.SOCK_STREAM ) as sock:
+        sock.connect( socketPath )
+        sock.sendall( ( json.dumps( req ) + "\n" ).encode() )
+        with sock.makefile( "rb") as fh:
+            resp = json.loads( fh.readline() )
+    sys.stdout.write( resp["output"] )
+    if not resp["ok"]:
+        logging.error( resp["error"] )
+    return resp["ok"]
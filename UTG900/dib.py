@@ -0,0 +1,111 @@
+"""
+In-memory decoding of UTG900 screen captures.
+
+`UTG962.llSShot` returns a Windows bitmap (BMP/DIB). It is decoded
+here without temporary files or external tools: pixel data is viewed
+in place with NumPy (no copy), mirrored left-right like the previous
+`convert -flop` and encoded to PNG with zlib. Other image formats
+use Pillow, when installed.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+# BITMAPINFOHEADER compression
+BI_RGB = 0
+BI_BITFIELDS = 3
+
+
+def dibArray( data, flop=True ):
+    """Decode BMP file content to RGB array
+
+    :data: bytes-like BMP file content
+
+    :flop: mirror image left-right (as the UTG900 capture is mirrored)
+
+    :return: uint8 array height x width x 3, top row first
+    """
+    buf = memoryview( data )
+    magic, _, _, _, pixOffset = struct.unpack_from( "<2sIHHI", buf, 0 )
+    if magic != b"BM":
+        raise ValueError( "Not a BMP image: {}".format( bytes(buf[:2])))
+    hdrSize, width, height, _, bpp, compression = struct.unpack_from( "<IiiHHI", buf, 14 )
+    topDown = height < 0
+    height = abs(height)
+    rowLen = ( width * bpp + 31 ) // 32 * 4
+    rows = np.frombuffer( buf, dtype=np.uint8, count=rowLen*height, offset=pixOffset ).reshape( height, rowLen )
+    if bpp in ( 24, 32 ):
+        nb = bpp // 8
+        pix = rows[:, :width*nb].reshape( height, width, nb )
+        rgb = pix[:, :, 2::-1]
+    elif bpp == 16:
+        pix = rows[:, :width*2].view( "<u2" )
+        if compression == BI_BITFIELDS:
+            masks = struct.unpack_from( "<III", buf, 14 + 40 )
+        else:
+            # BI_RGB 16 bit is 5-5-5
+            masks = ( 0x7c00, 0x03e0, 0x001f )
+        rgb = np.stack( [ _channel( pix, m ) for m in masks ], axis=-1 )
+    else:
+        raise ValueError( "Unsupported BMP bit count {}".format(bpp))
+    if not topDown:
+        rgb = rgb[::-1]
+    if flop:
+        rgb = rgb[:, ::-1]
+    return rgb
+
+
+class ImageFormatError( ValueError ):
+    """Image format can not be encoded in memory"""
+
+
+def _channel( pix, mask ):
+    """Scale 16 bit 'pix' bits selected by 'mask' to 0..255"""
+    shift = ( mask & -mask ).bit_length() - 1
+    maxVal = mask >> shift
+    return (( ( pix & mask ) >> shift ).astype( np.uint32 ) * 255 // maxVal ).astype( np.uint8 )
+
+
+def pngBytes( rgb, level=3 ):
+    """Encode RGB array to PNG file content"""
+    rgb = np.ascontiguousarray( rgb, dtype=np.uint8 )
+    height, width = rgb.shape[:2]
+    # Filter type 0 (None) in front of each row
+    raw = np.zeros( (height, width*3 + 1), dtype=np.uint8 )
+    raw[:, 1:] = rgb.reshape( height, width*3 )
+
+    def chunk( tag, payload ):
+        return struct.pack( ">I", len(payload)) + tag + payload \
+            + struct.pack( ">I", zlib.crc32( tag + payload ) & 0xffffffff )
+
+    return b"\x89PNG\r\n\x1a\n" \
+        + chunk( b"IHDR", struct.pack( ">IIBBBBB", width, height, 8, 2, 0, 0, 0 )) \
+        + chunk( b"IDAT", zlib.compress( raw.tobytes(), level )) \
+        + chunk( b"IEND", b"" )
+
+
+def imageBytes( rgb, ext ):
+    """Encode RGB array to image format 'ext' (png, jpg, ...)"""
+    ext = ext.lower().lstrip( ".")
+    if ext == "png":
+        return pngBytes( rgb )
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImageFormatError( "Image format '{}' requires Pillow, 'png' supported without".format(ext))
+    import io
+    out = io.BytesIO()
+    Image.fromarray( np.ascontiguousarray(rgb) ).save( out, format="JPEG" if ext == "jpg" else ext.upper())
+    return out.getvalue()
+
+
+def writeImage( data, resultPath, flop=True ):
+    """Decode BMP content 'data' and write it to 'resultPath' (format from extension)"""
+    ext = resultPath.rsplit( ".", 1)[-1] if "." in resultPath else "png"
+    # Encode first: no empty file left behind on failure
+    content = imageBytes( dibArray( data, flop=flop ), ext )
+    with open( resultPath, "wb") as fh:
+        fh.write( content )
+    return resultPath
@@ -0,0 +1,147 @@
+"""
+Fleet of UTG900 signal generators configured in parallel.
+
+`Fleet` opens several UTG900 resources (by default all UTG900s found
+by `list_resources()`), sharing one pyvisa ResourceManager, and
+applies per device configuration lists with one worker thread per
+instrument. Each device is configured in order, devices in parallel,
+and elapsed time is reported per device.
+
+Usage:
+
+  with Fleet() as fleet:
+      for r in fleet.configure( {
+            addr1: [ ("generate", dict(ch=1, wave="sine", freq="1kHz")) ],
+            addr2: [ ("arbGenerate", dict(ch=1, filePath="wave.csv")), ("on", dict(ch=2)) ],
+      }):
+          print( r.addr, r.elapsed, r.error )
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from absl import logging
+
+try:
+    from .UTG900 import UTG962, list_resources
+except ImportError:
+    from UTG900 import UTG962, list_resources
+
+# USB (vendor, product) id of UNI-T UTG900
+UTG900_USB_ID = ( 0x6656, 0x0834 )
+
+# Outcome of opening/configuring one device: 'elapsed' seconds,
+# 'result' list of method return values, 'error' exception or None
+DeviceResult = namedtuple( "DeviceResult", "addr elapsed result error" )
+
+
+def resourceUsbId( addr ):
+    """(vendor, product) id of USB resource 'addr', None for other
+    resources
+
+    Ids are given in decimal (USB0::26198::2100::...) or in hex
+    (USB0::0x6656::0x0834::...) depending on VISA backend.
+    """
+    fields = addr.split( "::")
+    if len(fields) < 3 or not fields[0].upper().startswith( "USB"):
+        return None
+    try:
+        return tuple( int( f, 16) if f.lower().startswith( "0x") else int( f ) for f in fields[1:3] )
+    except ValueError:
+        return None
+
+
+def fleetResources( usbId=UTG900_USB_ID ):
+    """UTG900 addresses among pyvisa resources
+
+    :usbId: (vendor, product) id of devices
+    """
+    return [ addr for addr in list_resources() if resourceUsbId( addr ) == tuple( usbId ) ]
+
+
+class Fleet:
+    """
+    UTG962 instances opened in parallel.
+
+    :addrs: resource addresses, default: fleetResources()
+
+    :kwargs: passed to UTG962 constructor (batch, pollReady, ...)
+    """
+
+    def __init__( self, addrs=None, **kwargs ):
+        if addrs is None:
+            addrs = fleetResources()
+        self.addrs = list( addrs )
+        self.sgens = {}
+        self.pool = ThreadPoolExecutor( max_workers=max( 1, len(self.addrs)), thread_name_prefix="utg900-fleet" )
+        self.opened = self.run( { addr: lambda addr=addr: self.open( addr, **kwargs ) for addr in self.addrs } )
+        failed = [ r for r in self.opened if r.error is not None ]
+        if failed:
+            self.close()
+            msg = "Fleet open failed: {}".format( ", ".join( "{}: {}".format( r.addr, r.error) for r in failed ))
+            logging.error(msg)
+            raise ValueError(msg)
+
+    def open( self, addr, **kwargs ):
+        sgen = UTG962( addr=addr, **kwargs )
+        self.sgens[addr] = sgen
+        return getattr( sgen, "idn", None )
+
+    def close( self ):
+        for addr, sgen in list( self.sgens.items()):
+            try:
+                sgen.close()
+            except Exception as err:
+                logging.error( "Closing {} failed: {}".format( addr, err ))
+            del self.sgens[addr]
+        self.pool.shutdown()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *exc ):
+        self.close()
+
+    def __getitem__( self, addr ):
+        return self.sgens[addr]
+
+    def run( self, jobs ):
+        """Run 'jobs' (dict addr -> callable) in parallel, one worker per device
+
+        :return: list of DeviceResult in 'jobs' order
+        """
+        def timed( addr, job ):
+            start = monotonic()
+            try:
+                result = job()
+                return DeviceResult( addr, monotonic() - start, result, None )
+            except Exception as err:
+                logging.error( "{}: {}".format( addr, err ))
+                return DeviceResult( addr, monotonic() - start, None, err )
+        futures = [ self.pool.submit( timed, addr, job ) for addr, job in jobs.items() ]
+        return [ f.result() for f in futures ]
+
+    def configure( self, configs ):
+        """Apply per device configuration lists in parallel
+
+        :configs: dict addr -> list of (methodName, kwargs), e.g.
+        ("generate", {"ch": 1, "wave": "sine", "freq": "1kHz"}); a
+        failing step skips the rest of the device list
+
+        :return: list of DeviceResult, 'result' lists step return values
+        """
+        for addr in configs:
+            if addr not in self.sgens:
+                msg = "Device '{}' not in fleet {}".format( addr, self.addrs )
+                logging.error(msg)
+                raise ValueError(msg)
+
+        def apply( sgen, steps ):
+            return [ getattr( sgen, method )( **kwargs ) for method, kwargs in steps ]
+
+        results = self.run( { addr: lambda addr=addr, steps=steps: apply( self.sgens[addr], steps )
+                              for addr, steps in configs.items() } )
+        for r in results:
+            logging.info( "configure: {} {:.3f}s {}".format( r.addr, r.elapsed, "ok" if r.error is None else r.error ))
+        return results
@@ -0,0 +1,269 @@
+"""
+Screen text decoding with glyph templates.
+
+Parameter values shown on the UTG900 display are read from a screen
+capture (`UTG962.llSShot`) in memory: the capture is thresholded to
+an ink mask, character cells of all text fields are gathered with a
+precomputed index array and matched against all glyph templates with
+one matrix product (pixel mismatch count), e.g.
+
+  screenText( dib.dibArray( sgen.llSShot() ))
+  -> { 1: { "wave": "SINE", "output": "ON", "freq": "2kHz", ... }, 2: ... }
+
+Text is matched against a `TemplateSet`: glyph templates && the
+screen layout of the text fields. `FONT` && `SIM_LAYOUT` describe
+only the screen rendered by the simulator (sim.py uses `renderText`,
+`simTemplates()`). Font && layout of a physical UTG962 are not known
+here: its template set is built from a reference capture showing
+known text with `calibrate`, stored with `saveTemplates` && loaded
+with `loadTemplates`, e.g.
+
+  tset = calibrate( rgb, { 1: { "wave": "SINE", "freq": "1.000000kHz", ... }}, layout=SIM_LAYOUT._replace( ... ))
+  saveTemplates( tset, "utg962.npz" )
+
+Requires numpy.
+"""
+
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# 5x7 font, '#' = ink
+FONT = {
+    "0": ( ".###.", "#...#", "#..##", "#.#.#", "##..#", "#...#", ".###." ),
+    "1": ( "..#..", ".##..", "..#..", "..#..", "..#..", "..#..", ".###." ),
+    "2": ( ".###.", "#...#", "....#", "...#.", "..#..", ".#...", "#####" ),
+    "3": ( "#####", "...#.", "..#..", "...#.", "....#", "#...#", ".###." ),
+    "4": ( "...#.", "..##.", ".#.#.", "#..#.", "#####", "...#.", "...#." ),
+    "5": ( "#####", "#....", "####.", "....#", "....#", "#...#", ".###." ),
+    "6": ( "..##.", ".#...", "#....", "####.", "#...#", "#...#", ".###." ),
+    "7": ( "#####", "....#", "...#.", "..#..", ".#...", ".#...", ".#..." ),
+    "8": ( ".###.", "#...#", "#...#", ".###.", "#...#", "#...#", ".###." ),
+    "9": ( ".###.", "#...#", "#...#", ".####", "....#", "...#.", ".##.." ),
+    ".": ( ".....", ".....", ".....", ".....", ".....", ".##..", ".##.." ),
+    "-": ( ".....", ".....", ".....", "#####", ".....", ".....", "....." ),
+    "%": ( "##...", "##..#", "...#.", "..#..", ".#...", "#..##", "...##" ),
+    "d": ( "....#", "....#", ".##.#", "#..##", "#...#", "#...#", ".####" ),
+    "e": ( ".....", ".....", ".###.", "#...#", "#####", "#....", ".###." ),
+    "g": ( ".....", ".####", "#...#", "#...#", ".####", "....#", ".###." ),
+    "k": ( "#....", "#....", "#..#.", "#.#..", "##...", "#.#..", "#..#." ),
+    "m": ( ".....", ".....", "##.#.", "#.#.#", "#.#.#", "#...#", "#...#" ),
+    "n": ( ".....", ".....", "#.##.", "##..#", "#...#", "#...#", "#...#" ),
+    "p": ( ".....", ".....", "####.", "#...#", "####.", "#....", "#...." ),
+    "r": ( ".....", ".....", "#.##.", "##..#", "#....", "#....", "#...." ),
+    "s": ( ".....", ".....", ".###.", "#....", ".###.", "....#", "####." ),
+    "u": ( ".....", ".....", "#...#", "#...#", "#...#", "#..##", ".##.#" ),
+    "z": ( ".....", ".....", "#####", "...#.", "..#..", ".#...", "#####" ),
+    "A": ( ".###.", "#...#", "#...#", "#####", "#...#", "#...#", "#...#" ),
+    "B": ( "####.", "#...#", "#...#", "####.", "#...#", "#...#", "####." ),
+    "E": ( "#####", "#....", "#....", "####.", "#....", "#....", "#####" ),
+    "F": ( "#####", "#....", "#....", "####.", "#....", "#....", "#...." ),
+    "H": ( "#...#", "#...#", "#...#", "#####", "#...#", "#...#", "#...#" ),
+    "I": ( ".###.", "..#..", "..#..", "..#..", "..#..", "..#..", ".###." ),
+    "L": ( "#....", "#....", "#....", "#....", "#....", "#....", "#####" ),
+    "M": ( "#...#", "##.##", "#.#.#", "#.#.#", "#...#", "#...#", "#...#" ),
+    "N": ( "#...#", "#...#", "##..#", "#.#.#", "#..##", "#...#", "#...#" ),
+    "O": ( ".###.", "#...#", "#...#", "#...#", "#...#", "#...#", ".###." ),
+    "P": ( "####.", "#...#", "#...#", "####.", "#....", "#....", "#...." ),
+    "Q": ( ".###.", "#...#", "#...#", "#...#", "#.#.#", "#..#.", ".##.#" ),
+    "R": ( "####.", "#...#", "#...#", "####.", "#.#..", "#..#.", "#...#" ),
+    "S": ( ".####", "#....", "#....", ".###.", "....#", "....#", "####." ),
+    "U": ( "#...#", "#...#", "#...#", "#...#", "#...#", "#...#", ".###." ),
+    "V": ( "#...#", "#...#", "#...#", "#...#", "#...#", ".#.#.", "..#.." ),
+}
+
+# Font pixel -> screen pixels
+SCALE = 2
+GLYPH_W = 5
+GLYPH_H = 7
+# Character cell (glyph + one column spacing), screen pixels
+CELL_W = ( GLYPH_W + 1 ) * SCALE
+CELL_H = GLYPH_H * SCALE
+
+# Simulator layout: channel panel x, text x, header (wave, output) && field rows
+CH_X = { 1: 0, 2: 240 }
+TEXT_X = 16
+OUTPUT_X = TEXT_X + 8 * CELL_W
+HEADER_Y = 8
+FIELD_Y = 36
+ROW_PITCH = 24
+# Field rows, top down (sim.py field names)
+FIELDS = ( "freq", "amp", "offset", "phase", "duty", "raise", "fall" )
+# Text field widths (characters)
+WAVE_CELLS = 6
+OUTPUT_CELLS = 3
+VALUE_CELLS = 14
+
+# Gray level counted as ink
+INK_LEVEL = 128
+# Max. mismatching pixels of a recognised character (fraction of cell)
+MAX_MISMATCH = 0.15
+# Character of unrecognised cell
+UNKNOWN = "?"
+
+# Text field layout, 'chX' tuple of (ch, panel x) -pairs
+Layout = namedtuple( "Layout", "chX textX outputX headerY fieldY rowPitch cellW cellH" )
+SIM_LAYOUT = Layout( tuple( CH_X.items()), TEXT_X, OUTPUT_X, HEADER_Y, FIELD_Y, ROW_PITCH, CELL_W, CELL_H )
+
+# Glyph templates: 'chars' list, 'templates' uint8 array nChars x
+# cellH*cellW, first char ' ' (empty cell), && their 'layout'
+TemplateSet = namedtuple( "TemplateSet", "chars templates layout" )
+
+
+def textBoxes( layout=SIM_LAYOUT ):
+    """Text fields on screen: list of (ch, field, x, y, nCells)"""
+    boxes = []
+    for ch, x in layout.chX:
+        boxes.append( ( ch, "wave", x + layout.textX, layout.headerY, WAVE_CELLS ))
+        boxes.append( ( ch, "output", x + layout.outputX, layout.headerY, OUTPUT_CELLS ))
+        for row, field in enumerate( FIELDS ):
+            boxes.append( ( ch, field, x + layout.textX, layout.fieldY + row * layout.rowPitch, VALUE_CELLS ))
+    return boxes
+
+
+def fieldPosition( ch, field, layout=SIM_LAYOUT ):
+    """Screen (x,y) of text 'field' ('wave', 'output' or one of FIELDS) of channel 'ch'"""
+    box = next( b for b in textBoxes( layout ) if b[0] == ch and b[1] == field )
+    return box[2], box[3]
+
+
+@lru_cache( maxsize=None )
+def glyphIndex():
+    """Simulator glyph templates (FONT)
+
+    :return: (chars, templates), templates uint8 array nChars x
+    CELL_H*CELL_W, first char ' ' (empty cell)
+    """
+    chars = [ " " ] + list( FONT )
+    templates = np.zeros( ( len(chars), CELL_H, CELL_W ), dtype=np.uint8 )
+    for i, c in enumerate( chars[1:], 1 ):
+        glyph = np.array( [ [ p == "#" for p in row ] for row in FONT[c] ], dtype=np.uint8 )
+        templates[i, :, :GLYPH_W*SCALE] = np.kron( glyph, np.ones( ( SCALE, SCALE ), dtype=np.uint8 ))
+    return chars, templates.reshape( len(chars), -1 )
+
+
+def simTemplates():
+    """Template set of the simulator screen, not valid for a physical device"""
+    chars, templates = glyphIndex()
+    return TemplateSet( chars, templates, SIM_LAYOUT )
+
+
+@lru_cache( maxsize=4 )
+def cellIndex( width, height, layout=SIM_LAYOUT ):
+    """Flat pixel indices of all text field cells on 'width' x
+    'height' screen, int array nCells x cellH*cellW"""
+    dy, dx = np.mgrid[ 0:layout.cellH, 0:layout.cellW ]
+    cells = []
+    for _, _, x, y, n in textBoxes( layout ):
+        for i in range( n ):
+            cx = x + i * layout.cellW
+            if y + layout.cellH > height or cx + layout.cellW > width:
+                raise ValueError( "Screen {}x{} smaller than text layout".format( width, height ))
+            cells.append( (( y + dy ) * width + cx + dx ).ravel() )
+    return np.stack( cells )
+
+
+def inkMask( rgb ):
+    """Boolean ink mask of RGB screen array"""
+    return rgb.max( axis=-1 ) >= INK_LEVEL
+
+
+def matchCells( cells, tset ):
+    """Characters of 'cells' (nCells x cellH*cellW, 0/1) matched
+    against template set 'tset'
+
+    Mismatch count |cell xor template| for all cells && templates
+    at once: sum(cell) + sum(template) - 2 cell.template
+    """
+    chars, templates = tset.chars, tset.templates
+    cells = cells.astype( np.float32 )
+    t = templates.astype( np.float32 )
+    mismatch = cells.sum( axis=1 )[:, None] + t.sum( axis=1 )[None, :] - 2 * cells @ t.T
+    best = mismatch.argmin( axis=1 )
+    ok = mismatch[ np.arange( len(best)), best ] <= MAX_MISMATCH * cells.shape[1]
+    return [ chars[b] if good else UNKNOWN for b, good in zip( best, ok ) ]
+
+
+def screenText( rgb, tset ):
+    """Decode text fields of RGB screen array (see dib.dibArray)
+    with template set 'tset'
+
+    :return: dict ch -> dict field -> text ('' for empty field)
+    """
+    height, width = rgb.shape[:2]
+    ink = inkMask( rgb ).ravel()
+    chars = matchCells( ink[ cellIndex( width, height, tset.layout ) ], tset )
+    result = { ch: {} for ch, _ in tset.layout.chX }
+    pos = 0
+    for ch, field, _, _, n in textBoxes( tset.layout ):
+        result[ch][field] = "".join( chars[pos:pos+n] ).strip()
+        pos += n
+    return result
+
+
+def renderText( ink, x, y, text ):
+    """Draw 'text' to boolean/0-1 array 'ink' at (x,y), characters not in FONT left empty"""
+    chars, templates = glyphIndex()
+    for i, c in enumerate( text ):
+        if c not in FONT: continue
+        cx = x + i * CELL_W
+        ink[ y:y+CELL_H, cx:cx+CELL_W ] |= templates[ chars.index(c) ].reshape( CELL_H, CELL_W ).astype( ink.dtype )
+    return ink
+
+
+def calibrate( rgb, expected, layout=SIM_LAYOUT ):
+    """Template set from reference capture 'rgb' showing known text
+
+    Each character cell of the text fields listed in 'expected' is
+    taken as template of the character shown there (pixel majority
+    over all its occurrences). Characters not shown on the reference
+    capture are not recognised later (decoded as UNKNOWN).
+
+    :expected: dict ch -> dict field -> text shown on capture, e.g.
+    { 1: { "wave": "SINE", "output": "OFF", "freq": "1.000000kHz" }}
+
+    :layout: text field layout of the capture
+
+    :raise ValueError: field unknown or text longer than its field
+    """
+    height, width = rgb.shape[:2]
+    ink = inkMask( rgb ).ravel()
+    index = cellIndex( width, height, layout )
+    # (ch, field) -> (first cell, nCells)
+    boxes = {}
+    pos = 0
+    for ch, field, _, _, n in textBoxes( layout ):
+        boxes[( ch, field )] = ( pos, n )
+        pos += n
+    samples = {}
+    for ch, fields in expected.items():
+        for field, text in fields.items():
+            if ( int(ch), field ) not in boxes or len( text ) > boxes[( int(ch), field )][1]:
+                raise ValueError( "calibrate: CH{} field '{}' unknown or text '{}' too long".format( ch, field, text ))
+            pos = boxes[( int(ch), field )][0]
+            for i, c in enumerate( text ):
+                if c == " ": continue
+                samples.setdefault( c, [] ).append( ink[ index[ pos + i ]] )
+    chars = [ " " ] + sorted( samples )
+    templates = np.zeros( ( len(chars), layout.cellH * layout.cellW ), dtype=np.uint8 )
+    for i, c in enumerate( chars[1:], 1 ):
+        templates[i] = np.mean( samples[c], axis=0 ) >= 0.5
+    return TemplateSet( chars, templates, layout )
+
+
+def saveTemplates( tset, filePath ):
+    """Store template set 'tset' to numpy .npz file 'filePath'"""
+    layout = tset.layout._replace( chX = [ list(p) for p in tset.layout.chX ] )
+    with open( filePath, "wb") as fh:
+        np.savez( fh, chars=np.array( tset.chars ), templates=tset.templates,
+                  layout=np.array( json.dumps( layout._asdict() )))
+
+
+def loadTemplates( filePath ):
+    """Template set stored with saveTemplates"""
+    with np.load( filePath ) as data:
+        layout = json.loads( str( data["layout"] ))
+        layout["chX"] = tuple( ( int(ch), int(x) ) for ch, x in layout["chX"] )
+        return TemplateSet( [ str(c) for c in data["chars"] ], data["templates"].astype( np.uint8 ), Layout( **layout ))
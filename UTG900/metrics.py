@@ -0,0 +1,196 @@
+"""
+Opt-in instrumentation of UTG962.
+
+`Metrics.attach( sgen )` wraps the pyvisa resource of a UTG962 to
+count writes, reads and bytes, and wraps its API methods to time them.
+Figures are collected per outermost API call (e.g. generate() includes
+the on() it calls), latency in histogram buckets. Time in pause()
+(fixed sleeps or *OPC? polling) is counted as sleep time. Transfers
+outside API calls are collected under method "other".
+
+Nothing changes for UTG962 instances without attached Metrics.
+
+Export with `toJson()` or `toPrometheus()` (text exposition format).
+"""
+
+import json
+from time import monotonic
+
+# Latency histogram upper bounds (seconds)
+LATENCY_BUCKETS = ( 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0 )
+
+# UTG962 methods timed
+API_METHODS = (
+    "reset", "on", "off", "generate", "configure", "arbGenerate", "sweep", "modeGenerate",
+    "modulate", "deviceSweep", "burst", "modeOff", "screenShot", "screenBurst", "screenArray",
+    "runPlan",
+)
+
+OTHER = "other"
+
+
+class CallStats:
+    """Totals && latency histogram of one API method"""
+
+    FIELDS = ( "calls", "seconds", "writes", "reads", "bytesSent", "bytesReceived", "sleepSeconds" )
+
+    def __init__( self ):
+        for f in self.FIELDS:
+            setattr( self, f, 0 )
+        self.buckets = [ 0 ] * len( LATENCY_BUCKETS )
+
+    def observe( self, seconds ):
+        self.calls += 1
+        self.seconds += seconds
+        for i, bound in enumerate( LATENCY_BUCKETS ):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def toDict( self ):
+        d = { f: getattr( self, f) for f in self.FIELDS }
+        d["histogram"] = { str(b): n for b, n in zip( LATENCY_BUCKETS, self.buckets ) }
+        return d
+
+
+class MeteredResource:
+    """pyvisa resource proxy counting transfers to Metrics"""
+
+    # Wrapped resource replaced by UTG962.reopen()
+    wraps = True
+
+    def __init__( self, resource, metrics ):
+        object.__setattr__( self, "resource", resource )
+        object.__setattr__( self, "metrics", metrics )
+
+    def __getattr__( self, name ):
+        return getattr( self.resource, name )
+
+    def __setattr__( self, name, value ):
+        setattr( self.resource, name, value )
+
+    def write( self, cmd ):
+        self.metrics.sent( len(cmd) )
+        return self.resource.write( cmd )
+
+    def write_raw( self, data ):
+        self.metrics.sent( len(data) )
+        return self.resource.write_raw( data )
+
+    def read_raw( self, *args, **kwargs ):
+        return self.metrics.received( self.resource.read_raw( *args, **kwargs ))
+
+    def read_bytes( self, *args, **kwargs ):
+        return self.metrics.received( self.resource.read_bytes( *args, **kwargs ))
+
+    def read( self ):
+        return self.metrics.received( self.resource.read() )
+
+    def query( self, cmd ):
+        self.metrics.sent( len(cmd) )
+        return self.metrics.received( self.resource.query( cmd ))
+
+
+class Metrics:
+    """
+    Per API method call statistics of UTG962 instances attached.
+    """
+
+    def __init__( self ):
+        self.methods = {}
+        self.active = None
+        self.depth = 0
+
+    def stats( self, method=None ):
+        method = method or self.active or OTHER
+        if method not in self.methods:
+            self.methods[method] = CallStats()
+        return self.methods[method]
+
+    # Transfer counting
+    def sent( self, nBytes ):
+        s = self.stats()
+        s.writes += 1
+        s.bytesSent += nBytes
+
+    def received( self, data ):
+        s = self.stats()
+        s.reads += 1
+        s.bytesReceived += len(data)
+        return data
+
+    def slept( self, seconds ):
+        self.stats().sleepSeconds += seconds
+
+    # Wrapping
+    def attach( self, sgen, methods=API_METHODS ):
+        """Instrument UTG962 'sgen' (instance attributes, class not modified)"""
+        sgen.sgen = MeteredResource( sgen.sgen, self )
+        for name in methods:
+            setattr( sgen, name, self.timed( name, getattr( sgen, name )))
+        sgen.pause = self.sleeping( sgen.pause )
+        return sgen
+
+    def timed( self, name, fn ):
+        def wrapper( *args, **kwargs ):
+            if self.depth > 0:
+                # Counted in outermost call
+                return fn( *args, **kwargs )
+            self.active = name
+            self.depth += 1
+            start = monotonic()
+            try:
+                return fn( *args, **kwargs )
+            finally:
+                self.stats( name ).observe( monotonic() - start )
+                self.depth -= 1
+                self.active = None
+        return wrapper
+
+    def sleeping( self, fn ):
+        def wrapper( secs ):
+            start = monotonic()
+            try:
+                return fn( secs )
+            finally:
+                self.slept( monotonic() - start )
+        return wrapper
+
+    # Export
+    def toDict( self ):
+        return { "buckets": list( LATENCY_BUCKETS ),
+                 "methods": { m: s.toDict() for m, s in sorted( self.methods.items()) } }
+
+    def toJson( self ):
+        return json.dumps( self.toDict(), indent=2 )
+
+    def toPrometheus( self, prefix="utg900" ):
+        lines = [
+            "# HELP {}_call_seconds UTG962 API call wall time".format( prefix ),
+            "# TYPE {}_call_seconds histogram".format( prefix ),
+        ]
+        for m, s in sorted( self.methods.items()):
+            cumulative = 0
+            for bound, n in zip( LATENCY_BUCKETS, s.buckets ):
+                cumulative += n
+                lines.append( '{}_call_seconds_bucket{{method="{}",le="{}"}} {}'.format( prefix, m, bound, cumulative ))
+            lines.append( '{}_call_seconds_bucket{{method="{}",le="+Inf"}} {}'.format( prefix, m, s.calls ))
+            lines.append( '{}_call_seconds_sum{{method="{}"}} {}'.format( prefix, m, s.seconds ))
+            lines.append( '{}_call_seconds_count{{method="{}"}} {}'.format( prefix, m, s.calls ))
+        for name, field, help in (
+                ( "writes_total", "writes", "Writes to device" ),
+                ( "reads_total", "reads", "Reads from device" ),
+                ( "bytes_sent_total", "bytesSent", "Bytes written to device" ),
+                ( "bytes_received_total", "bytesReceived", "Bytes read from device" ),
+                ( "sleep_seconds_total", "sleepSeconds", "Time in pause() (sleep or ready polling)" ),
+        ):
+            lines.append( "# HELP {}_{} {}".format( prefix, name, help ))
+            lines.append( "# TYPE {}_{} counter".format( prefix, name ))
+            for m, s in sorted( self.methods.items()):
+                lines.append( '{}_{}{{method="{}"}} {}'.format( prefix, name, m, getattr( s, field )))
+        return "\n".join( lines ) + "\n"
+
+    def write( self, path ):
+        """Write metrics to 'path': JSON if it ends with .json, else Prometheus text"""
+        with open( path, "w") as fh:
+            fh.write( self.toJson() if path.lower().endswith( ".json") else self.toPrometheus() )
@@ -0,0 +1,159 @@
+"""
+UTG900 front panel menu model.
+
+Follows the menu page, selected channel and focused field of the
+UTG900 display as key presses are sent, and plans the shortest key
+sequence from the current state to a target state.
+
+State is a `PanelState`, `None` means unknown (e.g. after *RST, or
+after the panel has been unlocked for the user).
+"""
+
+from collections import namedtuple, deque
+
+# node: "utility", "wave", "mode", "props1", "props2", "arbProps",
+#       "entry", "fileLocation", "upload"
+# page: props page of an "entry" (value being typed for 'focus')
+PanelState = namedtuple( "PanelState", "node ch page focus" )
+
+# Wave selection soft keys
+WAVE_KEYS = { 1: "sine", 2: "square", 3: "pulse", 4: "ramp", 5: "arb" }
+
+# Property pages: soft key -> field
+PAGES = {
+    "props1":   { 1: "freq", 2: "amp", 3: "offset", 4: "phase", 5: "duty" },
+    "props2":   { 1: "raise", 2: "fall" },
+    "arbProps": { 1: "file", 2: "freq", 3: "amp", 4: "offset", 5: "phase" },
+}
+
+# Page Down/Page Up soft key (F6)
+PAGE_FLIP = {
+    "props1": "props2",
+    "props2": "props1",
+}
+
+# Soft key of focused field toggles alternative (e.g. Freq/Period)
+TOGGLE_FIELDS = { "freq", "raise" }
+
+NUM_KEYS = { "NUM{}".format(d) for d in range(10) } | { "DOT", "SYMBOL" }
+
+# Keys used in planning
+NAV_KEYS = ( "Wave", "Utility", "Down", "Up", "F1", "F2", "F3", "F4", "F5", "F6" )
+
+
+def wavePage( wave ):
+    """Property page shown after selecting 'wave'"""
+    return "arbProps" if wave == "arb" else "props1"
+
+
+def pageFields( page ):
+    return list( PAGES[page].values())
+
+
+def step( state, key ):
+    """Panel state after pressing 'key' (KEY:<key> without prefix) in 'state'
+
+    :return: new PanelState, None if unknown
+    """
+    ch = None if state is None else state.ch
+    if key == "Utility":
+        return PanelState( "utility", ch, None, None )
+    if key == "Wave":
+        return PanelState( "wave", ch, None, None )
+    if key == "Mode":
+        return PanelState( "mode", ch, None, None )
+    if state is None:
+        return None
+    node = state.node
+    if key in ( "CH1", "CH2"):
+        # Output toggle, channel selection known only if it was this channel
+        return state if state.ch == int(key[2]) else state._replace( ch=None )
+    if key in NUM_KEYS:
+        if node in PAGES and state.focus is not None and state.focus != "file":
+            return PanelState( "entry", ch, node, state.focus )
+        return state if node == "entry" else None
+    if key in ( "Up", "Down"):
+        if node in PAGES and state.focus is not None:
+            fields = pageFields( node )
+            i = fields.index( state.focus ) + (1 if key == "Down" else -1)
+            return state._replace( focus=fields[ i % len(fields) ])
+        return state
+    if key in ( "Left", "Right"):
+        return state
+    if not ( key.startswith( "F") and key[1:].isdigit()):
+        return None
+    n = int(key[1:])
+    if node == "utility":
+        return state._replace( ch=n ) if n in (1, 2) else None
+    if node == "wave":
+        if n not in WAVE_KEYS: return None
+        page = wavePage( WAVE_KEYS[n] )
+        return PanelState( page, ch, None, pageFields(page)[0] )
+    if node in PAGES:
+        if n == 6 and node in PAGE_FLIP:
+            page = PAGE_FLIP[node]
+            return PanelState( page, ch, None, pageFields(page)[0] )
+        field = PAGES[node].get(n)
+        if field is None: return None
+        if field == "file":
+            return PanelState( "fileLocation", ch, None, None )
+        if field == state.focus and field in TOGGLE_FIELDS:
+            # Toggled alternative value: not modelled
+            return None
+        return PanelState( "entry", ch, node, field )
+    if node == "entry":
+        # Unit (or Cancel) key returns to property page
+        return PanelState( state.page, ch, None, state.focus )
+    if node == "fileLocation":
+        return PanelState( "upload", ch, None, None ) if n == 2 else None
+    return None
+
+
+def uploaded( state ):
+    """Panel state after arb file upload (write_raw)"""
+    if state is not None and state.node == "upload":
+        return PanelState( "arbProps", state.ch, None, "file" )
+    return None
+
+
+def _navigable( state, key ):
+    """True if 'key' only navigates in 'state' (does not change settings)"""
+    if key.startswith( "F") and state.node in ( "wave", "entry", "fileLocation", "upload", "mode"):
+        return False
+    return True
+
+
+def plan( state, goal, maxDepth=10 ):
+    """Shortest key sequence from 'state' to a state satisfying 'goal'
+
+    :goal: predicate PanelState -> bool
+
+    :return: list of keys, None if goal not reachable
+    """
+    if state is None: return None
+    if goal(state): return []
+    seen = { state }
+    queue = deque( [ (state, []) ] )
+    while queue:
+        s, keys = queue.popleft()
+        if len(keys) >= maxDepth: continue
+        for key in NAV_KEYS:
+            if not _navigable( s, key ): continue
+            nxt = step( s, key )
+            if nxt is None or nxt in seen: continue
+            if goal(nxt): return keys + [key]
+            seen.add( nxt )
+            # Entering value is not navigation
+            if nxt.node != "entry":
+                queue.append( (nxt, keys + [key]) )
+    return None
+
+
+def atWave( ch ):
+    """Goal: wave selection menu of channel 'ch'"""
+    return lambda s: s.node == "wave" and s.ch == ch
+
+
+def atEntry( ch, field ):
+    """Goal: typing value for 'field' on channel 'ch'"""
+    return lambda s: s.node == "entry" and s.ch == ch and s.focus == field
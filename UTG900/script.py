@@ -0,0 +1,271 @@
+"""
+UTG900 command script compiler.
+
+A script is a text file with one command per line, in command line
+syntax (see 'UTG900.py ?'), '#' starts a comment:
+
+  # 2 kHz sine on channel 1, square on channel 2
+  sine ch=1 freq=2kHz amp=1Vpp
+  square ch=2 freq=5kHz duty=25%
+  screen fileName=setup.png
+
+The whole script is parsed and compiled before anything is sent:
+commands run against a `ScriptRecorder`, which validates parameters
+(units, device resolution, files) and records the key plan of each
+command. Errors are reported for all lines at once. The compiled
+program then runs the plans on the device, `--dryRun` prints plans
+and their cost instead.
+
+Commands reading from the device (screen, sweep) and commands not
+using the device (version, list_resources, ?) are validated at
+compile time and run as command line commands.
+"""
+
+import copy
+import io
+import os
+import shlex
+from collections import namedtuple
+from contextlib import redirect_stdout
+
+from absl import logging
+
+try:
+    from .UTG900 import UTG962, KeyRecorder, UploadStep, localModule
+except ImportError:
+    from UTG900 import UTG962, KeyRecorder, UploadStep, localModule
+
+# Commands run as is, not compiled
+RUNTIME_CMDS = { "?", "version", "list_resources" }
+
+# Parsed script line
+Command = namedtuple( "Command", "line cmd props" )
+
+# Compiled command: 'tokens' command line, 'plan' KeyPlan (None:
+# run 'tokens'), 'shadow' channel shadows after command, 'checks'
+# channels to check on screen with --verify
+ScriptStep = namedtuple( "ScriptStep", "line tokens plan shadow checks" )
+
+# Cost estimate of compiled steps
+PlanCost = namedtuple( "PlanCost", "keys writes bytes uploadBytes pause" )
+
+
+def parseTokens( tokens, subMenu, line=None ):
+    """Group command line 'tokens' to Commands
+
+    Token without '=' starts a command, key=value tokens following
+    it are its parameters (in any order).
+
+    :return: (list of Command, list of error messages)
+    """
+    commands = []
+    errors = []
+    for tok in tokens:
+        key, sep, value = tok.partition( "=")
+        if not sep:
+            if tok not in subMenu:
+                errors.append( "{}unknown command '{}', valid: {}".format( _where(line), tok, list(subMenu.keys())))
+                commands.append( None )
+                continue
+            commands.append( Command( line, tok, {} ))
+            continue
+        if not commands:
+            errors.append( "{}parameter '{}' without command".format( _where(line), tok ))
+            continue
+        command = commands[-1]
+        if command is None:
+            continue
+        if key not in subMenu[command.cmd]:
+            errors.append( "{}invalid parameter '{}' for '{}', valid: {}".format( _where(line), key, command.cmd, list(subMenu[command.cmd].keys())))
+        elif key in command.props:
+            errors.append( "{}duplicate parameter '{}' for '{}'".format( _where(line), key, command.cmd ))
+        else:
+            command.props[key] = value
+    return [ c for c in commands if c is not None ], errors
+
+
+def parseScript( lines, subMenu ):
+    """Parse script 'lines' (one command per line)
+
+    :return: (list of Command, list of error messages)
+    """
+    commands = []
+    errors = []
+    for lineNo, text in enumerate( lines, 1 ):
+        try:
+            tokens = shlex.split( text, comments=True )
+        except ValueError as err:
+            errors.append( "{}{}".format( _where(lineNo), err ))
+            continue
+        if not tokens: continue
+        lineCommands, lineErrors = parseTokens( tokens, subMenu, line=lineNo )
+        commands += lineCommands
+        errors += lineErrors
+    return commands, errors
+
+
+def _where( line ):
+    return "" if line is None else "line {}: ".format( line )
+
+
+def commandTokens( command, subMenu ):
+    """Command line tokens of 'command', parameters in menu order"""
+    return [ command.cmd ] + [ "{}={}".format( k, command.props[k] ) for k in subMenu[command.cmd] if k in command.props ]
+
+
+class ScriptRecorder( KeyRecorder ):
+    """
+    KeyRecorder validating && modelling also commands run as is.
+
+    :sgen: UTG962 whose state compilation starts from, None: state
+    after opening device (=reset) with 'trackMenu'
+    """
+    def __init__( self, sgen=None, trackMenu=False ):
+        if sgen is None:
+            super().__init__( None, trackMenu, ( False, False ))
+            self.shadow = [ {}, {} ]
+        else:
+            super().__init__( sgen.panel, sgen.trackMenu, sgen.ch )
+            self.shadow = copy.deepcopy( sgen.shadow )
+        self.runtime = False
+        self.checks = []
+
+    # Screen checks recorded, run with the plan when sgen verifies
+    verify = True
+
+    def checkScreen( self, chs ):
+        self.checks += [ ch for ch in chs if ch not in self.checks ]
+
+    def ilUpload( self, filePath ):
+        # CSV encoding errors raised already by arbGeneratePlan
+        if not os.path.isfile( filePath ):
+            msg = "Waveform file '{}' not found".format( filePath )
+            logging.error(msg)
+            raise ValueError(msg)
+        super().ilUpload( filePath )
+
+    def screenShot( self, captureDir, fileName=None, ext="png" ):
+        self.runtime = True
+        self.llOpen()
+
+    def screenBurst( self, captureDir, count, interval=0.0, fileName=None, ext="png", workers=2, bufferSize=8 ):
+        if count < 1 or interval < 0:
+            msg = "Invalid screen burst count={}, interval={}".format( count, interval )
+            logging.error(msg)
+            raise ValueError(msg)
+        self.screenShot( captureDir )
+
+    def sweep( self, ch=1, wave="sine", field="freq", values=(), dwell=1.0, **params ):
+        ch = int(ch)
+        points = self.sweepPoints( field, values, wave )
+        if points:
+            self.generate( ch, wave, **dict( params, **{ field: points[0] }))
+            self.shadow[ch-1][field] = points[-1]
+        # Sweep leaves menu on props page, not modelled here
+        self.panel = None
+        self.runtime = True
+        return []
+
+
+def compileScript( commands, subMenu, runCommands, captureDir=None, sgen=None, trackMenu=False ):
+    """Compile 'commands' to list of ScriptStep
+
+    :runCommands: function( cmds, sgen, captureDir ) running command
+    line commands (see cli.runCommands)
+
+    :sgen: UTG962 whose current state compilation starts from (None:
+    state after opening device with 'trackMenu')
+
+    :raise ValueError: listing errors of all commands
+    """
+    recorder = ScriptRecorder( sgen, trackMenu=trackMenu )
+    program = []
+    errors = []
+    for command in commands:
+        tokens = commandTokens( command, subMenu )
+        if command.cmd in RUNTIME_CMDS:
+            program.append( ScriptStep( command.line, tokens, None, None, () ))
+            continue
+        recorder.steps = []
+        recorder.checks = []
+        recorder.runtime = False
+        try:
+            # Command output (e.g. sweep statistics) belongs to run
+            with redirect_stdout( io.StringIO() ):
+                runCommands( list(tokens), lambda: recorder, captureDir )
+        except Exception as err:
+            errors.append( "{}{}: {}".format( _where(command.line), " ".join(tokens), err ))
+            continue
+        plan = None if recorder.runtime else recorder.recordedPlan()
+        program.append( ScriptStep( command.line, tokens, plan, copy.deepcopy( recorder.shadow ), tuple( recorder.checks )))
+    if errors:
+        msg = "Script not valid:\n  " + "\n  ".join( errors )
+        logging.error(msg)
+        raise ValueError(msg)
+    return program
+
+
+def runProgram( program, sgen, runCommands, captureDir=None ):
+    """Run compiled 'program' on UTG962 'sgen'"""
+    for step in program:
+        logging.info( "run: {}".format( " ".join( step.tokens )))
+        if step.plan is None:
+            runCommands( list( step.tokens ), lambda: sgen, captureDir )
+            continue
+        sgen.runPlan( step.plan )
+        sgen.shadow = copy.deepcopy( step.shadow )
+        if sgen.verify and step.checks:
+            sgen.checkScreen( list( step.checks ))
+
+
+def planCost( plan, batch=None, batchMaxBytes=UTG962.batchMaxBytes ):
+    """Estimate cost of KeyPlan 'plan' when keys are coalesced by 'batch'"""
+    keys = writes = nBytes = uploadBytes = 0
+    pause = 0.0
+    buf = []
+    def flush():
+        nonlocal writes, nBytes
+        if buf:
+            writes += 1
+            nBytes += len( UTG962.batchSep.join(buf))
+            buf.clear()
+    for step in plan.steps:
+        if isinstance( step, str):
+            if step.startswith( "KEY:"):
+                keys += 1
+                if batch is not None and batch > 1:
+                    if buf and len( UTG962.batchSep.join(buf)) + len( UTG962.batchSep ) + len(step) > batchMaxBytes: flush()
+                    buf.append( step )
+                    if len(buf) >= batch: flush()
+                    continue
+            flush()
+            writes += 1
+            nBytes += len(step)
+        elif isinstance( step, UploadStep ):
+            flush()
+            writes += 1
+            if step.filePath.lower().endswith( ".csv"):
+                uploadBytes += len( localModule( "bsv" ).csvToBsv( step.filePath ))
+            else:
+                uploadBytes += os.path.getsize( step.filePath )
+        else:
+            flush()
+            pause += step
+    flush()
+    return PlanCost( keys, writes, nBytes, uploadBytes, pause )
+
+
+def printProgram( program, batch=None ):
+    """Print compiled program && cost estimate (dry run)"""
+    total = PlanCost( 0, 0, 0, 0, 0.0 )
+    for step in program:
+        cmd = " ".join( step.tokens )
+        where = "" if step.line is None else "{:4d}: ".format( step.line )
+        if step.plan is None:
+            print( "{}{:40s} run at execution".format( where, cmd ))
+            continue
+        cost = planCost( step.plan, batch=batch )
+        total = PlanCost( *( a + b for a, b in zip( total, cost )))
+        print( "{}{:40s} keys={:3d} writes={:3d} bytes={:5d} upload={:6d} pause={:.2f}s".format( where, cmd, *cost ))
+        logging.info( "  plan: {}".format( list( step.plan.steps )))
+    print( "Total: keys={} writes={} bytes={} upload={} pause={:.2f}s".format( *total ))
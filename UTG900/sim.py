@@ -0,0 +1,462 @@
+"""
+Simulated UNI-T UTG900 signal generator.
+
+Stand-in for the pyvisa resource opened by `UTG962`: it accepts the
+same SCPI/KEY commands, models the front panel menu state machine
+behind the `ll*` key presses and charges a configurable latency per
+transfer and per byte. Counters (`writes`, `reads`, `bytesWritten`,
+`bytesRead`, `keys`) allow measuring command cost without hardware.
+"""
+
+import struct
+from time import sleep, monotonic
+
+SIM_PREFIX = "SIM"
+SIM_IDN = "UNI-T Technologies,UTG900,SIM0000001,1.08"
+
+# Screen geometry of UTG962 (pixels)
+SCREEN_WIDTH = 480
+SCREEN_HEIGHT = 272
+# Vendor bytes between IEEE block header and the bitmap
+SSHOT_PREFIX = b"\x00\x00\x00\x00"
+
+# Soft key layout of the menu pages: F-key -> field
+WAVE_KEYS = { 1: "sine", 2: "square", 3: "pulse", 4: "ramp", 5: "arb" }
+PROPS1_KEYS = { 1: "freq", 2: "amp", 3: "offset", 4: "phase", 5: "duty" }
+PROPS2_KEYS = { 1: "raise", 2: "fall" }
+ARB_KEYS = { 1: "file", 2: "freq", 3: "amp", 4: "offset", 5: "phase" }
+
+# Fields shown on display per wave, top down
+WAVE_FIELDS = {
+    "sine":   ( "freq", "amp", "offset", "phase" ),
+    "square": ( "freq", "amp", "offset", "phase", "duty" ),
+    "pulse":  ( "freq", "amp", "offset", "phase", "duty", "raise", "fall" ),
+    "ramp":   ( "freq", "amp", "offset", "phase" ),
+    "arb":    ( "freq", "amp", "offset", "phase" ),
+}
+
+# Mode menu soft keys, && property pages of modes: F-key -> field
+MODE_KEYS = { 1: "am", 2: "fm", 3: "pm", 4: "sweep", 5: "burst" }
+MODE_OFF_KEY = 6
+MODE_PROPS = {
+    "am":    { 2: "freq", 3: "depth" },
+    "fm":    { 2: "freq", 3: "dev" },
+    "pm":    { 2: "freq", 3: "dev" },
+    "sweep": { 1: "start", 2: "stop", 3: "time" },
+    "burst": { 1: "count", 2: "period" },
+}
+
+# Unit soft keys when entering a value: F-key -> unit
+UNIT_KEYS = {
+    "freq":   { 1: "uHz", 2: "mHz", 3: "Hz", 4: "kHz", 5: "MHz" },
+    "amp":    { 1: "mVpp", 2: "Vpp", 3: "mVrms", 4: "Vrms" },
+    "offset": { 1: "mV", 2: "V" },
+    "phase":  { 1: "deg" },
+    "duty":   { 1: "%" },
+    "raise":  { 1: "ns", 2: "us", 3: "ms", 4: "s", 5: "ks" },
+    "fall":   { 1: "ns", 2: "us", 3: "ms", 4: "s", 5: "ks" },
+}
+
+# Unit soft keys of mode fields: (mode, field) -> F-key -> unit
+MODE_UNIT_KEYS = {
+    ("am", "freq"):     UNIT_KEYS["freq"],
+    ("am", "depth"):    UNIT_KEYS["duty"],
+    ("fm", "freq"):     UNIT_KEYS["freq"],
+    ("fm", "dev"):      UNIT_KEYS["freq"],
+    ("pm", "freq"):     UNIT_KEYS["freq"],
+    ("pm", "dev"):      UNIT_KEYS["phase"],
+    ("sweep", "start"): UNIT_KEYS["freq"],
+    ("sweep", "stop"):  UNIT_KEYS["freq"],
+    ("sweep", "time"):  UNIT_KEYS["raise"],
+    ("burst", "count"): { 1: "cyc" },
+    ("burst", "period"): UNIT_KEYS["raise"],
+}
+
+# Pressing soft key of the focused field toggles alternative
+ALT_FIELD = {
+    "freq":   "period",
+    "raise":  "width",
+}
+
+NUM_KEYS = {
+    "NUM0": "0", "NUM1": "1", "NUM2": "2", "NUM3": "3", "NUM4": "4",
+    "NUM5": "5", "NUM6": "6", "NUM7": "7", "NUM8": "8", "NUM9": "9",
+    "SYMBOL": "-", "DOT": ".",
+}
+
+
+def pageFields( page ):
+    """Fields, in focus (Up/Down) order, shown on menu 'page'"""
+    return {
+        "props1":   list(PROPS1_KEYS.values()),
+        "props2":   list(PROPS2_KEYS.values()),
+        "arbProps": list(ARB_KEYS.values()),
+    }.get(page, [])
+
+
+def bmpImage( width=SCREEN_WIDTH, height=SCREEN_HEIGHT, pixels=None, color=(0x20, 0x20, 0x20) ):
+    """Build 24 bit BMP file content
+
+    :pixels: optional bytes, width*height*3 BGR values, top row first
+
+    """
+    rowLen = (width * 3 + 3) & ~3
+    pad = b"\x00" * (rowLen - width * 3)
+    if pixels is None:
+        row = bytes(color) * width + pad
+        data = row * height
+    else:
+        rows = [ pixels[y*width*3:(y+1)*width*3] + pad for y in range(height) ]
+        # BMP rows are stored bottom-up
+        data = b"".join( reversed(rows) )
+    dibHeader = struct.pack( "<IiiHHIIiiII", 40, width, height, 1, 24, 0, len(data), 2835, 2835, 0, 0 )
+    fileHeader = struct.pack( "<2sIHHI", b"BM", 14 + len(dibHeader) + len(data), 0, 0, 14 + len(dibHeader) )
+    return fileHeader + dibHeader + data
+
+
+class UTG962Sim:
+    """
+    Simulated UTG900 pyvisa resource.
+
+    :writeLatency: seconds charged per transfer (write or read)
+
+    :byteLatency: seconds charged per byte transferred
+
+    :settleTime: seconds device stays busy after a key press (*OPC?
+    blocks until settled)
+    """
+
+    writeLatency = 0.0
+    byteLatency = 0.0
+    settleTime = 0.0
+
+    def __init__( self, addr=SIM_PREFIX, writeLatency=None, byteLatency=None, settleTime=None, idn=SIM_IDN ):
+        self.resource_name = addr
+        self.idn = idn
+        self.timeout = 2000
+        if writeLatency is not None: self.writeLatency = writeLatency
+        if byteLatency is not None: self.byteLatency = byteLatency
+        if settleTime is not None: self.settleTime = settleTime
+        self.busyUntil = 0.0
+        self.files = {}
+        self.clearCounters()
+        self.powerOn()
+
+    # Counters
+    def clearCounters( self ):
+        self.writes = 0
+        self.reads = 0
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.keys = 0
+        self.latency = 0.0
+        self.log = []
+        self.errors = []
+
+    def counters( self ):
+        return {
+            "writes": self.writes,
+            "reads": self.reads,
+            "bytesWritten": self.bytesWritten,
+            "bytesRead": self.bytesRead,
+            "keys": self.keys,
+            "latency": self.latency,
+        }
+
+    # Device state
+    def powerOn( self ):
+        self.locked = False
+        self.ch = 1
+        self.out = [ False, False ]
+        self.chan = [ self.defaultChannel(), self.defaultChannel() ]
+        self.menu = "wave"
+        self.focus = None
+        self.entry = None
+        self.buffer = ""
+        self.carrier = None
+        self.response = None
+
+    @staticmethod
+    def defaultChannel():
+        return {
+            "wave": "sine",
+            "freq": "1kHz",
+            "amp": "100mVpp",
+            "offset": "0mV",
+            "phase": "0deg",
+            "duty": "50%",
+            "raise": "1us",
+            "fall": "1us",
+            "file": None,
+            "alt": set(),
+            "mode": None,
+            "modeProps": {},
+        }
+
+    def channel( self ):
+        return self.chan[self.ch-1]
+
+    # Transport latency model
+    def _charge( self, nBytes ):
+        cost = self.writeLatency + nBytes * self.byteLatency
+        self.latency += cost
+        if cost > 0: sleep( cost )
+
+    # pyvisa resource interface
+    def close( self ):
+        pass
+
+    def write( self, cmd ):
+        self.writes += 1
+        self.bytesWritten += len(cmd)
+        self._charge( len(cmd))
+        # SCPI: header after ';' is relative to the path of previous
+        # command unless it starts with ':' (root) or '*' (common)
+        path = ""
+        for c in cmd.split(";"):
+            c = c.strip()
+            if not c or c.startswith( "*"):
+                self.execute( c )
+                continue
+            c = c[1:] if c.startswith( ":") else path + c
+            head = c.partition( " ")[0]
+            path = head[:head.rfind( ":") + 1]
+            self.execute( c )
+        return len(cmd)
+
+    def write_raw( self, data ):
+        self.writes += 1
+        self.bytesWritten += len(data)
+        self._charge( len(data))
+        self.upload( bytes(data) )
+        return len(data)
+
+    def read_raw( self, size=None ):
+        data = self.response if self.response is not None else b""
+        self.response = None
+        self.reads += 1
+        self.bytesRead += len(data)
+        self._charge( len(data))
+        return data
+
+    def read_bytes( self, count, chunk_size=None, break_on_termchar=False ):
+        """Read exactly 'count' bytes of pending response"""
+        data = self.response if self.response is not None else b""
+        if len(data) < count:
+            raise IOError( "Timeout: {} bytes pending, {} requested".format( len(data), count ))
+        self.response = data[count:] if len(data) > count else None
+        data = data[:count]
+        self.reads += 1
+        self.bytesRead += count
+        self._charge( count )
+        return data
+
+    def read( self ):
+        return self.read_raw().decode( "latin-1")
+
+    def query( self, cmd ):
+        self.write( cmd )
+        return self.read()
+
+    # Command interpreter
+    def execute( self, cmd ):
+        if not cmd: return
+        self.log.append( cmd )
+        head, _, arg = cmd.partition( " ")
+        headU = head.upper()
+        if headU.startswith( "KEY:"):
+            self.keys += 1
+            self.key( head[4:] )
+            self.busyUntil = monotonic() + self.settleTime
+        elif headU == "*IDN?":
+            self.respond( (self.idn + "\n").encode() )
+        elif headU == "*OPC?":
+            wait = self.busyUntil - monotonic()
+            if wait > 0: sleep( wait )
+            self.respond( b"1\n" )
+        elif headU == "*RST":
+            self.powerOn()
+        elif headU == "SYSTEM:LOCK":
+            self.locked = arg.strip().lower() == "on"
+        elif headU == "DISPLAY:DATA?":
+            self.respond( self.screenBlock() )
+        elif headU == "WARB1:CARRIER":
+            self.carrier = arg.rstrip( chr(0) )
+        else:
+            self.errors.append( cmd )
+
+    def respond( self, data ):
+        """Queue query response after unread output (a reader leaving
+        bytes unread gets them first on next read)"""
+        self.response = data if self.response is None else self.response + data
+
+    def upload( self, data ):
+        if self.carrier is None:
+            self.errors.append( "write_raw without carrier")
+            return
+        self.files[self.carrier] = data
+        self.channel()["file"] = self.carrier
+        self.carrier = None
+        self.menu = "arbProps"
+
+    def key( self, key ):
+        if key == "Utility":
+            self.menu = "utility"
+        elif key == "Wave":
+            self.menu = "wave"
+        elif key == "Mode":
+            self.menu = "mode"
+        elif key in ( "CH1", "CH2"):
+            n = int(key[2])
+            self.out[n-1] = not self.out[n-1]
+        elif key in NUM_KEYS:
+            self.numKey( NUM_KEYS[key] )
+        elif key in ( "Up", "Down"):
+            self.moveFocus( 1 if key == "Down" else -1 )
+        elif key in ( "Left", "Right"):
+            pass
+        elif key.startswith( "F") and key[1:].isdigit():
+            self.softKey( int(key[1:]))
+        else:
+            self.errors.append( "KEY:{}".format(key))
+
+    def page( self ):
+        """Props page for current wave"""
+        return "arbProps" if self.channel()["wave"] == "arb" else "props1"
+
+    def moveFocus( self, step ):
+        fields = pageFields( self.menu )
+        if not fields or self.focus not in fields: return
+        self.focus = fields[ (fields.index(self.focus) + step) % len(fields) ]
+
+    def numKey( self, ch ):
+        if self.menu in ( "props1", "props2", "arbProps" ) and self.focus in UNIT_KEYS:
+            # Digit on props page starts entry for focused field
+            self.entry = self.focus
+            self.entryPage = self.menu
+            self.buffer = ""
+            self.menu = "entry"
+        if self.menu != "entry":
+            self.errors.append( "digit '{}' in menu {}".format( ch, self.menu))
+            return
+        self.buffer += ch
+
+    def selectField( self, field ):
+        if self.focus == field and field in ALT_FIELD:
+            # Soft key of focused field toggles alternative
+            self.channel()["alt"] ^= { field }
+        self.focus = field
+        self.entry = field
+        self.entryPage = self.menu
+        self.buffer = ""
+        self.menu = "entry"
+
+    def softKey( self, n ):
+        menu = self.menu
+        if menu == "utility":
+            if n in ( 1, 2 ): self.ch = n
+        elif menu == "wave":
+            if n in WAVE_KEYS:
+                self.channel()["wave"] = WAVE_KEYS[n]
+                self.menu = self.page()
+                self.focus = pageFields( self.menu )[0]
+        elif menu == "props1":
+            if n == 6:
+                self.menu = "props2"
+                self.focus = pageFields( "props2" )[0]
+            elif n in PROPS1_KEYS:
+                self.selectField( PROPS1_KEYS[n] )
+        elif menu == "props2":
+            if n == 6:
+                self.menu = "props1"
+                self.focus = pageFields( "props1" )[0]
+            elif n in PROPS2_KEYS:
+                self.selectField( PROPS2_KEYS[n] )
+        elif menu == "arbProps":
+            if n == 1:
+                self.focus = "file"
+                self.menu = "fileLocation"
+            elif n in ARB_KEYS:
+                self.selectField( ARB_KEYS[n] )
+        elif menu == "fileLocation":
+            if n == 2: self.menu = "upload"
+        elif menu == "entry":
+            self.commitEntry( n )
+        elif menu == "mode":
+            if n == MODE_OFF_KEY:
+                self.channel()["mode"] = None
+                self.channel()["modeProps"] = {}
+                self.menu = self.page()
+            elif n in MODE_KEYS:
+                self.channel()["mode"] = MODE_KEYS[n]
+                self.menu = "modeProps"
+                self.focus = None
+        elif menu == "modeProps":
+            field = MODE_PROPS[self.channel()["mode"]].get(n)
+            if field is not None:
+                self.focus = field
+                self.entry = field
+                self.entryPage = self.menu
+                self.buffer = ""
+                self.menu = "entry"
+        elif menu == "upload":
+            pass
+
+    def commitEntry( self, n ):
+        if self.entryPage == "modeProps":
+            units = MODE_UNIT_KEYS[( self.channel()["mode"], self.entry )]
+            if n in units and self.buffer:
+                self.channel()["modeProps"][self.entry] = self.buffer + units[n]
+            elif n not in units:
+                self.errors.append( "unit key F{} for {}".format( n, self.entry))
+                return
+            self.buffer = ""
+            self.menu = self.entryPage
+            return
+        units = UNIT_KEYS[self.entry]
+        if self.entry == "amp" and n == 6:
+            # Cancel
+            self.menu = self.entryPage
+            return
+        if n not in units:
+            self.errors.append( "unit key F{} for {}".format( n, self.entry))
+            return
+        if self.buffer:
+            self.channel()[self.entry] = self.buffer + units[n]
+        self.buffer = ""
+        self.menu = self.entryPage
+
+    # Screen
+    def screen( self ):
+        """Bitmap currently on display: wave, output state && parameter
+        values of both channels in the glyph font of glyphs.py
+        (mirrored like UTG900 captures), blank without numpy"""
+        try:
+            import numpy as np
+            try:
+                from . import glyphs
+            except ImportError:
+                import glyphs
+        except ImportError:
+            return bmpImage()
+        ink = np.zeros( ( SCREEN_HEIGHT, SCREEN_WIDTH ), dtype=bool )
+        for ch, chan in enumerate( self.chan, 1 ):
+            x, y = glyphs.fieldPosition( ch, "wave")
+            glyphs.renderText( ink, x, y, chan["wave"].upper() )
+            x, y = glyphs.fieldPosition( ch, "output")
+            glyphs.renderText( ink, x, y, "ON" if self.out[ch-1] else "OFF" )
+            for field in WAVE_FIELDS.get( chan["wave"], () ):
+                x, y = glyphs.fieldPosition( ch, field )
+                glyphs.renderText( ink, x, y, chan[field] )
+        pixels = np.where( ink[:, ::-1, None], np.uint8( 0xe0 ), np.uint8( 0x20 ))
+        return bmpImage( pixels=np.repeat( pixels, 3, axis=2 ).tobytes() )
+
+    def screenBlock( self ):
+        """Display:Data? response: IEEE 488.2 definite length block
+        && response terminator"""
+        payload = SSHOT_PREFIX + self.screen()
+        return b"#9" + "{:09d}".format(len(payload)).encode() + payload + b"\n"
+
+
+def isSimAddr( addr ):
+    return addr is not None and addr.upper().startswith( SIM_PREFIX )
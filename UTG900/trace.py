@@ -0,0 +1,208 @@
+"""
+VISA traffic recorder && replayer.
+
+`TraceRecorder` wraps the pyvisa resource of a UTG962 and records
+every transaction (time, duration, operation, payload) to a trace
+file, one JSON object per line (gzip compressed when the file name
+ends with .gz). Binary payloads are base64 encoded.
+
+`ReplayResource` stands in for the device: writes are matched
+against the trace, reads are answered from it. On close it reports
+writes missing from or added to the trace and the timing difference
+between the recorded session and the replay, e.g.
+
+  UTG900.py --record session.trace.gz sine ch=1 freq=2kHz screen
+  UTG900.py --addr REPLAY:session.trace.gz sine ch=1 freq=2kHz screen
+
+Operations: 'w' write, 'W' write_raw, 'r' read_raw, 'b' read_bytes,
+'q' query.
+"""
+
+import base64
+import gzip
+import json
+from time import monotonic, sleep
+
+from absl import logging
+
+REPLAY_PREFIX = "REPLAY:"
+
+# Trace entries searched ahead to resynchronise after a mismatch
+RESYNC_WINDOW = 64
+
+
+def isReplayAddr( addr ):
+    return addr is not None and addr.upper().startswith( REPLAY_PREFIX )
+
+
+def _open( path, mode ):
+    if path.endswith( ".gz"):
+        return gzip.open( path, mode + "t", encoding="utf-8")
+    return open( path, mode, encoding="utf-8")
+
+
+def _encode( data ):
+    if isinstance( data, str):
+        return { "s": data }
+    return { "x": base64.b64encode( bytes(data) ).decode( "ascii") }
+
+
+def _decode( entry ):
+    if "s" in entry: return entry["s"]
+    return base64.b64decode( entry["x"] )
+
+
+def readTrace( path ):
+    """List of trace entries in 'path'"""
+    with _open( path, "r") as fh:
+        return [ json.loads( line ) for line in fh if line.strip() ]
+
+
+class TraceRecorder:
+    """
+    pyvisa resource proxy recording transactions to 'path'.
+    """
+
+    # Wrapped resource replaced by UTG962.reopen()
+    wraps = True
+
+    def __init__( self, resource, path ):
+        object.__setattr__( self, "resource", resource )
+        object.__setattr__( self, "fh", _open( path, "w") )
+        object.__setattr__( self, "start", monotonic() )
+        logging.info( "Recording VISA trace to {}".format(path))
+
+    def __getattr__( self, name ):
+        return getattr( self.resource, name )
+
+    def __setattr__( self, name, value ):
+        setattr( self.resource, name, value )
+
+    def record( self, op, fn, arg=None, request=None ):
+        t = monotonic()
+        result = fn() if arg is None else fn( arg )
+        entry = { "t": round( t - self.start, 6 ), "d": round( monotonic() - t, 6 ), "op": op }
+        if request is not None:
+            entry["req"] = _encode( request )
+        if op in ( "r", "b", "q"):
+            entry["resp"] = _encode( result )
+        if op == "b":
+            entry["n"] = arg
+        self.fh.write( json.dumps( entry, separators=(",", ":")) + "\n" )
+        return result
+
+    def write( self, cmd ):
+        return self.record( "w", self.resource.write, cmd, request=cmd )
+
+    def write_raw( self, data ):
+        return self.record( "W", self.resource.write_raw, data, request=data )
+
+    def read_raw( self, size=None ):
+        return self.record( "r", self.resource.read_raw )
+
+    def read_bytes( self, count, chunk_size=None, break_on_termchar=False ):
+        return self.record( "b", self.resource.read_bytes, count )
+
+    def read( self ):
+        data = self.record( "r", self.resource.read_raw )
+        return data.decode( "latin-1")
+
+    def query( self, cmd ):
+        return self.record( "q", self.resource.query, cmd, request=cmd )
+
+    def close( self ):
+        self.fh.close()
+        self.resource.close()
+
+
+class ReplayResource:
+    """
+    pyvisa resource answering from a recorded trace.
+
+    :realtime: sleep recorded transfer durations (device latency)
+    """
+
+    def __init__( self, addr, realtime=False ):
+        self.resource_name = addr
+        self.path = addr[len(REPLAY_PREFIX):]
+        self.entries = readTrace( self.path )
+        self.pos = 0
+        self.realtime = realtime
+        self.timeout = 2000
+        self.start = None
+        self.last = None
+        self.missing = []
+        self.extra = []
+        logging.info( "Replaying {} VISA transactions from {}".format( len(self.entries), self.path))
+
+    def next( self, op, request=None ):
+        """Trace entry matching 'op' && 'request', resynchronising on mismatch"""
+        now = monotonic()
+        if self.start is None:
+            self.start = now
+        for i in range( self.pos, min( len(self.entries), self.pos + RESYNC_WINDOW )):
+            entry = self.entries[i]
+            if entry["op"] != op: continue
+            if request is not None and _decode( entry["req"] ) != request: continue
+            # Entries skipped were not done in replay
+            self.missing += self.entries[self.pos:i]
+            self.pos = i + 1
+            self.last = ( entry, now )
+            if self.realtime: sleep( entry["d"] )
+            return entry
+        self.extra.append( { "t": round( now - self.start, 6 ), "op": op, "req": _encode( request ) if request is not None else None } )
+        return None
+
+    def write( self, cmd ):
+        self.next( "w", cmd )
+        return len(cmd)
+
+    def write_raw( self, data ):
+        self.next( "W", bytes(data) )
+        return len(data)
+
+    def read_raw( self, size=None ):
+        entry = self.next( "r")
+        return _decode( entry["resp"] ) if entry is not None else b""
+
+    def read_bytes( self, count, chunk_size=None, break_on_termchar=False ):
+        entry = self.next( "b")
+        if entry is None or entry["n"] != count:
+            raise IOError( "Replay: no recorded read of {} bytes at transaction {}".format( count, self.pos ))
+        return _decode( entry["resp"] )
+
+    def read( self ):
+        return self.read_raw().decode( "latin-1")
+
+    def query( self, cmd ):
+        entry = self.next( "q", cmd )
+        if entry is None:
+            raise IOError( "Replay: query '{}' not in trace".format( cmd ))
+        return _decode( entry["resp"] )
+
+    def report( self ):
+        """Differences between trace and replay"""
+        missing = self.missing + self.entries[self.pos:]
+        recorded = self.entries[-1]["t"] + self.entries[-1]["d"] if self.entries else 0.0
+        replayed = ( monotonic() - self.start ) if self.start is not None else 0.0
+        return {
+            "transactions": len(self.entries),
+            "missing": len(missing),
+            "extra": len(self.extra),
+            "recordedSeconds": recorded,
+            "replaySeconds": replayed,
+            "deltaSeconds": replayed - recorded,
+            "missingOps": [ ( e["op"], _decode( e["req"] ) if "req" in e and "s" in e["req"] else None ) for e in missing[:20] ],
+            "extraOps": [ ( e["op"], e["req"]["s"] if e["req"] and "s" in e["req"] else None ) for e in self.extra[:20] ],
+        }
+
+    def close( self ):
+        r = self.report()
+        msg = "Replay {}: {} transactions, {} missing, {} extra, recorded {:.3f}s, replay {:.3f}s ({:+.3f}s)".format(
+            self.path, r["transactions"], r["missing"], r["extra"], r["recordedSeconds"], r["replaySeconds"], r["deltaSeconds"] )
+        if r["missing"] or r["extra"]:
+            logging.warning( msg )
+            for op, req in r["missingOps"]: logging.warning( "  missing: {} {}".format( op, req ))
+            for op, req in r["extraOps"]: logging.warning( "  extra:   {} {}".format( op, req ))
+        else:
+            logging.info( msg )
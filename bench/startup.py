@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark of UTG900.py
+
+Runs commands, which do not need a device, repeatedly in fresh
+interpreters and reports wall clock time per invocation. Also
+reports, whether importing the library imports pyvisa.
+
+Usage: python bench/startup.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ )))
+SCRIPT = os.path.join( ROOT, "UTG900", "UTG900.py" )
+
+CASES = {
+    "python -c pass":           [ "-c", "pass" ],
+    "import UTG900":            [ "-c", "import UTG900" ],
+    "UTG900.py version":        [ SCRIPT, "version" ],
+    "UTG900.py ? command=sine": [ SCRIPT, "?", "command=sine" ],
+}
+
+
+def timeRuns( args, runs ):
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run( [ sys.executable ] + args, cwd=ROOT, check=True,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL )
+        times.append( perf_counter() - start )
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser( description=__doc__.strip().split("\n")[0] )
+    parser.add_argument( "--runs", type=int, default=20 )
+    args = parser.parse_args()
+    print( "{:28s} {:>10s} {:>10s}".format( "case", "median ms", "min ms" ))
+    for name, cmd in CASES.items():
+        times = timeRuns( cmd, args.runs )
+        print( "{:28s} {:10.1f} {:10.1f}".format( name, 1000*statistics.median(times), 1000*min(times) ))
+    out = subprocess.run( [ sys.executable, "-c", "import sys, UTG900; print( 'pyvisa' in sys.modules )" ],
+                          cwd=ROOT, check=True, capture_output=True, text=True ).stdout.strip()
+    print( "pyvisa imported by 'import UTG900': {}".format( out ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of UTG900 host side hot paths
+
+Runs each case repeatedly against the simulated UTG900 (sim.py, no
+transfer latency, readiness polled with *OPC? instead of fixed
+sleeps) and reports per operation host CPU time, wall time, device
+writes and bytes written/read.
+
+Results are compared to the stored baseline (bench/baseline.json):
+writes && bytes are deterministic and must not grow, CPU time may
+grow at most --tolerance. CPU times are compared relative to a fixed
+calibration workload timed right before each case, which evens out
+machine speed and load differences.
+
+Usage: python bench/suite.py [--list] [--runs N] [--case NAME ...] [--save] [--check]
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from time import perf_counter, process_time
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ )))
+sys.path.insert( 0, os.path.join( ROOT, "UTG900" ))
+
+from absl import logging
+
+import cli
+from UTG900 import UTG962, compilePlan, encodeValue, parseValUnit
+
+BASELINE = os.path.join( ROOT, "bench", "baseline.json" )
+BSV_FILE = os.path.join( ROOT, "data", "simplewave.bsv" )
+CSV_FILE = os.path.join( ROOT, "data", "simplewave.csv" )
+
+# Commands in chained command line cases
+CHAIN = 50
+# Values in parsing cases
+# (within device range, see UTG900.UNIT_RANGE)
+VALUES = [ "{}{}".format( v, u ) for v in ( "1", "2.5", "10", "0.001", "12.345678" ) for u in ( "Hz", "kHz", "MHz" ) ] \
+    + [ "{}{}".format( v, u ) for v in ( "1", "2.5", "10", "0.5" ) for u in ( "mVpp", "Vpp", "mV", "V" ) ] \
+    + [ "-20mV", "-1.5V" ]
+FREQS = [ "{}Hz".format( 1000 + 7*i ) for i in range( 100 ) ]
+
+# Result fields compared exactly against baseline
+EXACT = ( "writes", "bytesWritten", "bytesRead" )
+# Min. duration of one sample (ms)
+SAMPLE_MS = 50
+
+
+def chainTokens( n=CHAIN ):
+    """Command line of 'n' chained sine/square/pulse commands"""
+    cmds = []
+    for i in range( n ):
+        cmd = ( "sine", "square", "pulse" )[i % 3]
+        cmds += [ cmd, "ch={}".format( 1 + i % 2 ), "freq={}kHz".format( 1 + i ), "amp={}mVpp".format( 100 + 10*i ) ]
+        if cmd != "sine":
+            cmds.append( "duty={}%".format( 10 + i ))
+    return cmds
+
+
+# Cases: function( sgen, tmpDir ) running one iteration, returns number of operations
+def caseCliChain( sgen, tmpDir ):
+    cli.runCommands( chainTokens(), lambda: sgen, tmpDir )
+    return CHAIN
+
+
+def casePromptValue( sgen, tmpDir ):
+    cmds = chainTokens()
+    n = 0
+    while cmds:
+        cmd = cli.promptValue( "Command", cmds=cmds, validValues=cli.mainMenu.keys() )
+        props = { "sine": cli.sineProps, "square": cli.squareProps, "pulse": cli.pulseProps }[cmd]
+        { k: cli.promptValue( v, key=k, cmds=cmds ) for k, v in props.items() }
+        n += 1
+    return n
+
+
+def caseValUnit( sgen, tmpDir ):
+    for s in VALUES * 20:
+        value, unit = parseValUnit.__wrapped__( s )
+        family = UTG962.ampUnit if "pp" in unit else UTG962.offsetUnit if unit.endswith( "V") else UTG962.freqUnit
+        encodeValue( value, unit, tuple( family ))
+    return 20 * len( VALUES )
+
+
+def casePlanGenerate( sgen, tmpDir ):
+    compilePlan.cache_clear()
+    for f in FREQS:
+        sgen.generatePlan( 1, "square", force=True, freq=f, amp="1Vpp", duty="25%" )
+    return len( FREQS )
+
+
+def caseGenerate( sgen, tmpDir ):
+    for f in FREQS[:20]:
+        sgen.generate( ch=1, wave="sine", freq=f )
+    return 20
+
+
+def caseArbGenerate( sgen, tmpDir ):
+    sgen.arbGenerate( ch=2, filePath=BSV_FILE, fileName="BENCH", freq="1kHz", force=True )
+    return 1
+
+
+def caseUploadBsv( sgen, tmpDir ):
+    sgen.ilWriteFile( BSV_FILE, "BENCH" )
+    return 1
+
+
+def caseUploadCsv( sgen, tmpDir ):
+    sgen.ilWriteFile( CSV_FILE, "BENCH" )
+    return 1
+
+
+def caseScreenShot( sgen, tmpDir ):
+    sgen.ilScreenShot( os.path.join( tmpDir, "bench.png" ))
+    return 1
+
+
+def caseScreenCapture( sgen, tmpDir ):
+    dibPath = os.path.join( tmpDir, "bench.bmp" )
+    with open( dibPath, "wb") as fh:
+        fh.write( sgen.llSShot() )
+    return 1
+
+
+def caseScreenConvert( sgen, tmpDir ):
+    caseScreenCapture( sgen, tmpDir )
+    sgen.dibToImage( os.path.join( tmpDir, "bench.bmp" ), os.path.join( tmpDir, "bench-convert.png" ))
+    return 1
+
+
+def caseVerifyScreen( sgen, tmpDir ):
+    sgen.verifyScreen()
+    return 1
+
+
+CASES = {
+    "cli.chain":       ( caseCliChain,      "runCommands, {} chained commands".format( CHAIN )),
+    "cli.promptValue": ( casePromptValue,   "promptValue parsing of {} chained commands".format( CHAIN )),
+    "valUnit":         ( caseValUnit,       "parseValUnit + encodeValue, uncached" ),
+    "plan.generate":   ( casePlanGenerate,  "generatePlan key plan compilation, cold cache" ),
+    "generate":        ( caseGenerate,      "generate() freq change on device" ),
+    "arbGenerate":     ( caseArbGenerate,   "arbGenerate() with .bsv upload" ),
+    "upload.bsv":      ( caseUploadBsv,     "ilWriteFile .bsv" ),
+    "upload.csv":      ( caseUploadCsv,     "ilWriteFile .csv (encoded to bsv)" ),
+    "screen":          ( caseScreenShot,    "ilScreenShot, in-memory decode to PNG" ),
+    "screen.capture":  ( caseScreenCapture, "llSShot to .bmp file, device I/O of screen.convert" ),
+    "screen.convert":  ( caseScreenConvert, "llSShot + dibToImage (ImageMagick convert)" ),
+    "screen.verify":   ( caseVerifyScreen,  "verifyScreen glyph decoding" ),
+}
+
+
+def available( name ):
+    """None if case 'name' can run, else reason to skip it"""
+    if name == "screen.convert" and shutil.which( "convert") is None:
+        return "ImageMagick convert not installed"
+    return None
+
+
+def calibrate( runs ):
+    """CPU time (ms) of fixed pure Python workload"""
+    times = []
+    for _ in range( max( runs, 5 )):
+        cpu0 = process_time()
+        for i in range( 2000 ):
+            "{}kHz".format( i ).partition( "k")
+            sorted( str(j) for j in range( 20 ))
+        times.append( 1000 * ( process_time() - cpu0 ))
+    return min( times )
+
+
+def runCase( name, runs, tmpDir ):
+    """Per operation figures of case 'name' over 'runs' samples, times
+    of the fastest sample
+
+    Each sample repeats the case for at least SAMPLE_MS (garbage
+    collection off) to keep timer && scheduling noise small.
+    """
+    fn = CASES[name][0]
+    calibration = calibrate( runs )
+    sgen = UTG962( addr="SIM", pollReady=True )
+    sim = sgen.sgen
+    # Warm up (imports, caches), repeats per sample
+    cpu0 = process_time()
+    fn( sgen, tmpDir )
+    repeat = max( 1, int( SAMPLE_MS / max( 1000 * ( process_time() - cpu0 ), 0.01 )))
+    samples = []
+    for _ in range( runs ):
+        sim.clearCounters()
+        gc.collect()
+        gc.disable()
+        try:
+            cpu0, wall0 = process_time(), perf_counter()
+            ops = sum( fn( sgen, tmpDir ) for _ in range( repeat ))
+            cpu, wall = process_time() - cpu0, perf_counter() - wall0
+        finally:
+            gc.enable()
+        samples.append( ( cpu / ops, wall / ops, sim.writes / ops, sim.bytesWritten / ops, sim.bytesRead / ops ))
+    sgen.close()
+    return {
+        "ops": ops // repeat,
+        "calibrationMs": calibration,
+        "cpuMs": 1000 * min( s[0] for s in samples ),
+        "wallMs": 1000 * min( s[1] for s in samples ),
+        "writes": statistics.median( s[2] for s in samples ),
+        "bytesWritten": statistics.median( s[3] for s in samples ),
+        "bytesRead": statistics.median( s[4] for s in samples ),
+    }
+
+
+def compare( result, base, tolerance ):
+    """Differences of 'result' to baseline 'base'
+
+    :return: (list of regressions, list of other notes)
+    """
+    regressions, notes = [], []
+    for f in EXACT:
+        if result[f] > base[f]:
+            regressions.append( "{} {:g} -> {:g}".format( f, base[f], result[f] ))
+        elif result[f] < base[f]:
+            notes.append( "{} {:g} -> {:g}".format( f, base[f], result[f] ))
+    speed = result["calibrationMs"] / base["calibrationMs"]
+    ratio = result["cpuMs"] / ( base["cpuMs"] * speed ) if base["cpuMs"] > 0 else 1.0
+    if ratio > 1 + tolerance:
+        regressions.append( "cpu {:+.0f}%".format( 100 * ( ratio - 1 )))
+    elif ratio < 1 - tolerance:
+        notes.append( "cpu {:+.0f}%".format( 100 * ( ratio - 1 )))
+    return regressions, notes
+
+
+def main():
+    parser = argparse.ArgumentParser( description=__doc__.strip().split("\n")[0] )
+    parser.add_argument( "--runs", type=int, default=10 )
+    parser.add_argument( "--case", action="append", choices=list( CASES ), help="Case to run (repeatable), default all" )
+    parser.add_argument( "--baseline", default=BASELINE )
+    parser.add_argument( "--tolerance", type=float, default=0.4, help="Allowed relative CPU time growth" )
+    parser.add_argument( "--save", action="store_true", help="Store results as baseline" )
+    parser.add_argument( "--check", action="store_true", help="Exit with status 1 on regression" )
+    parser.add_argument( "--list", action="store_true", help="List cases" )
+    args = parser.parse_args()
+    if args.list:
+        for name, ( _, doc ) in CASES.items():
+            print( "{:16s} {}".format( name, doc ))
+        return
+    logging.set_verbosity( logging.ERROR )
+
+    baseline = {}
+    if os.path.exists( args.baseline ):
+        with open( args.baseline, "r") as fh:
+            baseline = json.load( fh )
+    results = {}
+    regressed = False
+    print( "{:16s} {:>5s} {:>9s} {:>9s} {:>8s} {:>10s} {:>10s}  vs baseline".format(
+        "case", "ops", "cpu ms/op", "wall ms", "writes", "bytes out", "bytes in" ))
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for name in args.case or CASES:
+            skip = available( name )
+            if skip is not None:
+                print( "{:16s} skipped: {}".format( name, skip ))
+                continue
+            r = results[name] = runCase( name, args.runs, tmpDir )
+            if name in baseline:
+                regressions, notes = compare( r, baseline[name], args.tolerance )
+                regressed = regressed or bool( regressions )
+                status = "; ".join( [ "REGRESSION " + d for d in regressions ] + notes ) or "ok"
+            else:
+                status = "no baseline"
+            print( "{:16s} {:5d} {:9.3f} {:9.3f} {:8.2f} {:10.1f} {:10.1f}  {}".format(
+                name, r["ops"], r["cpuMs"], r["wallMs"], r["writes"], r["bytesWritten"], r["bytesRead"], status ))
+    if args.save:
+        baseline.update( results )
+        with open( args.baseline, "w") as fh:
+            json.dump( baseline, fh, indent=2, sort_keys=True )
+            fh.write( "\n" )
+        print( "Baseline written to {}".format( args.baseline ))
+    if args.check and regressed:
+        sys.exit( 1 )
+
+
+if __name__ == '__main__':
+    main()
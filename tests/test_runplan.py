@@ -0,0 +1,101 @@
+"""
+Output state tracking of UTG962.runPlan against the simulator
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ))))
+
+from UTG900.UTG900 import UTG962
+from UTG900.sim import UTG962Sim
+
+
+class FailAfterKey:
+    """Simulator resource failing the write following 'key' once
+    armed ('onKey': the write carrying 'key', unknown if applied)"""
+
+    def __init__( self, sim, key="KEY:CH1", onKey=False ):
+        self.sim = sim
+        self.key = key
+        self.onKey = onKey
+        self.armed = False
+        self.keySent = False
+
+    def __getattr__( self, name ):
+        return getattr( self.sim, name )
+
+    def write( self, cmd ):
+        if self.armed and self.keySent:
+            self.armed = False
+            raise OSError( "write after {} failed".format( self.key ))
+        if self.armed and self.key in [ c.lstrip( ":") for c in cmd.split( ";") ]:
+            self.keySent = True
+            if self.onKey:
+                self.armed = False
+                self.sim.write( cmd )
+                raise OSError( "write of {} failed".format( self.key ))
+        return self.sim.write( cmd )
+
+
+@pytest.fixture
+def sgen():
+    resource = FailAfterKey( UTG962Sim())
+    sgen = UTG962( addr="SIM", resource=resource )
+    sgen.generate( ch=1, wave="sine", freq="1kHz" )
+    assert sgen.ch == [ True, False ]
+    yield sgen
+    sgen.close()
+
+
+def test_failure_after_ch_key( sgen ):
+    resource = sgen.sgen
+    resource.armed = True
+    # Wave change switches CH1 off first
+    with pytest.raises( OSError ):
+        sgen.generate( ch=1, wave="square", freq="2kHz" )
+    assert resource.keySent
+    assert sgen.ch == resource.sim.out == [ False, False ]
+    sgen.generate( ch=1, wave="square", freq="2kHz" )
+    assert sgen.ch == resource.sim.out == [ True, False ]
+
+
+def test_malformed_csv_sends_nothing( sgen, tmp_path ):
+    csvFile = tmp_path / "bad.csv"
+    csvFile.write_text( "[DATA]\nnot a number\n" )
+    writes = sgen.sgen.sim.writes
+    with pytest.raises( ValueError ):
+        sgen.arbGenerate( ch=1, filePath=str( csvFile ), fileName="BAD" )
+    assert sgen.sgen.sim.writes == writes
+    assert sgen.ch == sgen.sgen.sim.out == [ True, False ]
+
+
+def test_failure_on_ch_key( sgen ):
+    resource = sgen.sgen
+    resource.armed = True
+    resource.onKey = True
+    with pytest.raises( OSError ):
+        sgen.generate( ch=1, wave="square", freq="2kHz" )
+    # Toggle may have reached device: refused until reset()
+    assert sgen.ch == [ None, False ]
+    with pytest.raises( ValueError ):
+        sgen.on( 1 )
+    with pytest.raises( ValueError ):
+        sgen.generate( ch=1, wave="square", freq="2kHz" )
+    sgen.reset()
+    sgen.generate( ch=1, wave="square", freq="2kHz" )
+    assert sgen.ch == resource.sim.out == [ True, False ]
+
+
+def test_reopen_abort_after_ch_key( sgen ):
+    resource = sgen.sgen
+    sgen.retries, sgen.retryDelay = 3, 0.0
+    resource.armed = True
+    with pytest.raises( IOError ):
+        sgen.generate( ch=1, wave="square", freq="2kHz" )
+    assert sgen.shadow == [ {}, {} ]
+    assert sgen.ch == resource.sim.out == [ False, False ]
+    sgen.generate( ch=1, wave="square", freq="2kHz" )
+    assert sgen.ch == resource.sim.out == [ True, False ]